@@ -127,6 +127,9 @@ LOL_BINS = [
     "xwizard.exe",
     "pwsh.exe",
 ]
+# Every LOL bin name ends with ".exe", see references_lol_bin
+_LOL_BIN_SET = frozenset(LOL_BINS)
+_LOL_BIN_NAMES = tuple(LOL_BINS)
 
 pa_targets = (
     "c:\\windows\\system32\\lsass.exe",
@@ -162,6 +165,71 @@ susp_file_ext = (
     ".com",
 )
 
+# Registry key paths checked by is_windows_autorun
+_AUTORUNS = (
+    "\\currentcontrolset\\control\\terminal server\\winstations\\rdp-tcp\\initialprogram",
+    "\\currentcontrolset001\\control\\terminal server\\winstations\\rdp-tcp\\initialprogram",
+    "\\microsoft\\windows nt\\currentversion\\winlogon\\gpextensions",
+    "\\currentcontrolset\\services\\winsock",
+    "\\currentcontrolset001\\services\\winsock",
+    "\\microsoft\\windows\\currentversion\\explorer\\shelliconoverlayidentifiers",
+    "\\microsoft\\wab\\dllpath",
+    "\\microsoft\\windows\\currentversion\\controlpanel\\cpls",
+    "\\currentcontrolset\\control\\session manager\\bootexecute",
+    "\\currentcontrolset001\\control\\session manager\\bootexecute",
+    "\\currentcontrolset\\control\\session manager\\appcertdlls",
+    "\\currentcontrolset001\\control\\session manager\\appcertdlls",
+    "\\wow6432node\\microsoft\\windows nt\\currentversion\\drivers32",
+    "\\microsoft\\windows nt\\currentversion\\aedebug",
+    "\\microsoft\\windows\\currentversion\\runservicesonce",
+    "\\microsoft\\windows\\currentversion\\runservices",
+    "\\microsoft\\windows nt\\currentversion\\winlogon",
+    "\\microsoft\\windows\\currentversion\\shellserviceobjectdelayload",
+    "\\microsoft\\windows\\currentversion\\runonce",
+    "\\microsoft\\windows\\currentversion\\runonceex",
+    "\\microsoft\\windows\\currentversion\\run",
+    "\\microsoft\\windows\\currentversion\\runonce",
+    "\\microsoft\\windows\\currentversion\\policies\\explorer\\run",
+    "\\microsoft\\windows nt\\currentversion\\windows\\load",
+    "\\microsoft\\windows nt\\currentversion\\windows\\run",
+    "\\microsoft\\windows nt\\currentversion\\windows",
+    "\\microsoft\\windows nt\\currentversion\\windows\\appinit_dlls",
+    "\\microsoft\\windows nt\\currentversion\\windows\\loadappinit_dlls",
+    "\\microsoft\\windows\\currentversion\\explorer\\user shell folders",
+    "\\microsoft\\windows\\currentversion\\explorer\\shell folders",
+    "\\microsoft\\windows nt\\currentversion\\winlogon\\userinit",
+    "\\microsoft\\windows nt\\currentversion\\winlogon\\notify",
+    "\\microsoft\\windows nt\\currentversion\\winlogon\\shell",
+    "\\microsoft\\windows nt\\currentversion\\winlogon\\system",
+    "\\microsoft\\windows\\currentversion\\explorer\\browser helper objects",
+    "\\microsoft\\office test\\special\\perf",
+    "\\microsoft\\windows nt\\currentversion\\appcompatflags\\installedsdb",
+    "\\microsoft\\windows nt\\currentversion\\appcompatflags\\custom",
+    "environment\\userinitmprlogonscript",
+    "control panel\\desktop\\scrnsave.exe",
+    "\\ms-settings\\shell\\open\\command\\delegateexecute",
+    "shell\\open\\command\\(default)",
+    "user shell folders\\startup",
+)
+# A key containing one of these paths also contains any path that is a substring of it,
+# so only the paths not containing another one have to be checked
+_AUTORUN_KEYS = tuple(
+    a for a in dict.fromkeys(_AUTORUNS) if not any(b != a and b in a for b in _AUTORUNS)
+)
+
+_CLSID_RUN = (
+    "\\inprochandler",
+    "\\inprocserver",
+    "\\inprocserver32",
+    "\\localserver",
+    "\\localserver32\\shellex",
+    "\\progid",
+    "\\treatas",
+    "\\scriptleturl",
+)
+
+_SERV_RUN = ("\\imagepath", "\\binpath", "\\servicedll", "\\servicemanifest")
+
 def filter_mft_path(_filepath):
     """
     Filters $MFT entries by image path
@@ -179,16 +247,14 @@ def filter_mft_path(_filepath):
     if filepath.startswith("windows\\"):
         return False
     # Too much uninteresting data
-    if filepath.startswith("program files\\") or filepath.startswith("program files (x86)\\"):
+    if filepath.startswith(("program files\\", "program files (x86)\\")):
         return False
     # Too much uninteresting data
     if "winsxs" in filepath:
         return False
     
-    if filepath.startswith("users\\") or filepath.startswith("programdata\\") or ("\\temp\\" in filepath) or ("\\tmp\\" in filepath):
-        for ext in susp_file_ext:
-            if filepath.endswith(ext):
-                return True
+    if filepath.startswith(("users\\", "programdata\\")) or ("\\temp\\" in filepath) or ("\\tmp\\" in filepath):
+        return filepath.endswith(susp_file_ext)
     
     return False
 
@@ -215,180 +281,196 @@ def filter_evtx_event(data):
         
         channel = system.get("Channel")
         event_id = int(system.get("EventID", 0))
+        # Only kept events have their SystemTime parsed
         system_time = system["TimeCreated"]["#attributes"]["SystemTime"]
-        utc = ts_to_utc(system_time)
     except Exception as e:
         print(e)
         return None, None
 
+    if _keep_evtx_event(channel, event_id, event_data) is True:
+        return data, ts_to_utc(system_time)
+    return None, None
+
+
+def _keep_evtx_event(channel, event_id, event_data):
+    """
+    Checks whether an EVTX event is kept by its Channel, EventID and event attributes.
+
+    Args:
+        channel (str): The channel of the event.
+        event_id (int): The event ID of the event.
+        event_data (dict): The EventData of the event.
+    Returns:
+        bool: True if the entry is to be kept, False if it is meant to be discarded.
+    """
     match channel:
         # LOL bins are the glue for incidents, they're always in there somewhere
         case "Microsoft-Windows-Sysmon/Operational":
             match event_id:
                 case 1:# Process Create
                     if is_lol_bin(event_data.get("Image")):
-                        return data, utc
+                        return True
                     if is_lol_bin(event_data.get("OriginalFileName")):
-                        return data, utc
+                        return True
                     if is_lol_bin(event_data.get("ParentImage")):
-                        return data, utc
+                        return True
                 case 3:# Network Connection
                     if event_data.get("DestinationPort") in INTERESTING_PORTS:
-                        return data, utc
+                        return True
                     if event_data.get("SourcePort") in INTERESTING_PORTS:
-                        return data, utc
+                        return True
                 case 8:# Create Remote Thread
                     if is_lol_bin(event_data.get("SourceImage")):
-                        return data, utc
+                        return True
                     if is_lol_bin(event_data.get("TargetImage")):
-                        return data, utc
+                        return True
                     target_image = str(event_data.get("TargetImage"))
                     if target_image.casefold().endswith(pa_targets) and not target_image.casefold().endswith(pa_filter_source):
-                        return data, utc
+                        return True
                 case 10:# Process Access
                     if is_lol_bin(event_data.get("SourceImage")):
-                        return data, utc
+                        return True
                     if is_lol_bin(event_data.get("TargetImage")):
-                        return data, utc
+                        return True
                     target_image = str(event_data.get("TargetImage"))
                     if target_image.casefold().endswith(pa_targets) and not target_image.casefold().endswith(pa_filter_source):
-                        return data, utc
+                        return True
                 case 11:# File Create
                     target_filename = str(event_data.get("TargetFilename"))
                     if is_lol_bin(target_filename) or is_lol_bin(event_data.get("Image")):
                         if target_filename.endswith(susp_file_ext):
-                            return data, utc
+                            return True
                 case 12:# Registry create/delete
                     if event_data.get("EventType") == "CreateKey":
                         target_obj = event_data.get("TargetObject", "")
                         if is_windows_autorun(target_obj):
-                            return data, utc
+                            return True
                 case 13:# Registry value Set
                     if event_data.get("EventType") == "SetValue":
                         target_obj = event_data.get("Details", "")
                         if references_lol_bin(target_obj):
-                            return data, utc
+                            return True
                 case 19:# WmiEvent Filter
-                    return data, utc
+                    return True
                 case 20:# WmiEvent Consumer
-                    return data, utc
+                    return True
                 case 21:# WmiEvent Consumer to Filter
-                    return data, utc
+                    return True
         case "Security":
             match event_id:
                 case 4624:
                     if event_data.get("LogonType") in ( 5, 7, 10 ) and event_data.get("IpAddress") != "-":
-                        return data, utc
+                        return True
                 case 4625:
                     if not (event_data.get("IpAddress") in ( "0.0.0.0", "127.0.0.1" ) ) and not (event_data.get("IpAddress", "").startswith("fe")):
-                        return data, utc
+                        return True
                 case 4634:
-                    return data, utc
+                    return True
                 case 4647:
-                    return data, utc
+                    return True
                 case 4648:
-                    return data, utc
+                    return True
                 case 4779:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-PowerShell/Operational":
             match event_id:
                 case 4103:
-                    return data, utc
+                    return True
                 case 4104:
-                    return data, utc
+                    return True
                 case 40961:
-                    return data, utc
+                    return True
                 case 40962:
-                    return data, utc
+                    return True
                 case 24577:
-                    return data, utc
+                    return True
                 case 8193:
-                    return data, utc
+                    return True
                 case 8194:
-                    return data, utc
+                    return True
                 case 8197:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-WinRM/Operational":
             match event_id:
                 case 91:
-                    return data, utc
+                    return True
                 case 168:
-                    return data, utc
+                    return True
                 case 169:
-                    return data, utc
+                    return True
                 case 254:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-WMI-Activity/Operational":
             match event_id:
                 case 5857:
-                    return data, utc
+                    return True
                 case 5858:
-                    return data, utc
+                    return True
                 case 5860:
-                    return data, utc
+                    return True
                 case 5861:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-Windows Defender/Operational":
             match event_id:
                 case 1006:
-                    return data, utc
+                    return True
                 case 1007:
-                    return data, utc
+                    return True
                 case 1116:
-                    return data, utc
+                    return True
                 case 1117:
-                    return data, utc
+                    return True
                 case 1118:
-                    return data, utc
+                    return True
                 case 1119:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational":
             match event_id:
                 case 21:
-                    return data, utc
+                    return True
                 case 22:
-                    return data, utc
+                    return True
                 case 23:
-                    return data, utc
+                    return True
                 case 24:
-                    return data, utc
+                    return True
                 case 25:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-TerminalServices-RemoteConnectionManager/Operational":
             match event_id:
                 case 1149:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-TerminalServices-RDPClient/Operational":
             match event_id:
                 case 1024:
-                    return data, utc
+                    return True
                 case 1025:
-                    return data, utc
+                    return True
                 case 1102:
-                    return data, utc
+                    return True
                 case 1103:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-TaskScheduler/Operational":
             match event_id:
                 case 106:
-                    return data, utc
+                    return True
                 case 129:
-                    return data, utc
+                    return True
                 case 140:
-                    return data, utc
+                    return True
                 case 141:
-                    return data, utc
+                    return True
                 case 200:
-                    return data, utc
+                    return True
                 case 201:
-                    return data, utc
+                    return True
         case "Microsoft-Windows-RemoteDesktopServices-RdpCoreTS/Operational":
             match event_id:
                 case 131:
-                    return data, utc
+                    return True
                 case 140:
-                    return data, utc
-    return None, None
+                    return True
+    return False
 
 
 def is_windows_autorun(_reg_key):
@@ -401,79 +483,20 @@ def is_windows_autorun(_reg_key):
         bool: True if the entry an AutoRun, False if not.
     """
     reg_key = str(_reg_key).casefold()
-    
-    autoruns = [
-        "\\currentcontrolset\\control\\terminal server\\winstations\\rdp-tcp\\initialprogram",
-        "\\currentcontrolset001\\control\\terminal server\\winstations\\rdp-tcp\\initialprogram",
-        "\\microsoft\\windows nt\\currentversion\\winlogon\\gpextensions",
-        "\\currentcontrolset\\services\\winsock",
-        "\\currentcontrolset001\\services\\winsock",
-        "\\microsoft\\windows\\currentversion\\explorer\\shelliconoverlayidentifiers",
-        "\\microsoft\\wab\\dllpath",
-        "\\microsoft\\windows\\currentversion\\controlpanel\\cpls",
-        "\\currentcontrolset\\control\\session manager\\bootexecute",
-        "\\currentcontrolset001\\control\\session manager\\bootexecute",
-        "\\currentcontrolset\\control\\session manager\\appcertdlls",
-        "\\currentcontrolset001\\control\\session manager\\appcertdlls",
-        "\\wow6432node\\microsoft\\windows nt\\currentversion\\drivers32",
-        "\\microsoft\\windows nt\\currentversion\\aedebug",
-        "\\microsoft\\windows\\currentversion\\runservicesonce",
-        "\\microsoft\\windows\\currentversion\\runservices",
-        "\\microsoft\\windows nt\\currentversion\\winlogon",
-        "\\microsoft\\windows\\currentversion\\shellserviceobjectdelayload",
-        "\\microsoft\\windows\\currentversion\\runonce",
-        "\\microsoft\\windows\\currentversion\\runonceex",
-        "\\microsoft\\windows\\currentversion\\run",
-        "\\microsoft\\windows\\currentversion\\runonce",
-        "\\microsoft\\windows\\currentversion\\policies\\explorer\\run",
-        "\\microsoft\\windows nt\\currentversion\\windows\\load",
-        "\\microsoft\\windows nt\\currentversion\\windows\\run",
-        "\\microsoft\\windows nt\\currentversion\\windows",
-        "\\microsoft\\windows nt\\currentversion\\windows\\appinit_dlls",
-        "\\microsoft\\windows nt\\currentversion\\windows\\loadappinit_dlls",
-        "\\microsoft\\windows\\currentversion\\explorer\\user shell folders",
-        "\\microsoft\\windows\\currentversion\\explorer\\shell folders",
-        "\\microsoft\\windows nt\\currentversion\\winlogon\\userinit",
-        "\\microsoft\\windows nt\\currentversion\\winlogon\\notify",
-        "\\microsoft\\windows nt\\currentversion\\winlogon\\shell",
-        "\\microsoft\\windows nt\\currentversion\\winlogon\\system",
-        "\\microsoft\\windows\\currentversion\\explorer\\browser helper objects",
-        "\\microsoft\\office test\\special\\perf",
-        "\\microsoft\\windows nt\\currentversion\\appcompatflags\\installedsdb",
-        "\\microsoft\\windows nt\\currentversion\\appcompatflags\\custom",
-        "environment\\userinitmprlogonscript",
-        "control panel\\desktop\\scrnsave.exe",
-        "\\ms-settings\\shell\\open\\command\\delegateexecute",
-        "shell\\open\\command\\(default)",
-        "user shell folders\\startup",
-    ]
 
-    clsid_run = [
-        "\\inprochandler",
-        "\\inprocserver",
-        "\\inprocserver32",
-        "\\localserver",
-        "\\localserver32\\shellex",
-        "\\progid",
-        "\\treatas",
-        "\\scriptleturl",
-    ]
-
-    serv_run = ["\\imagepath", "\\binpath", "\\servicedll", "\\servicemanifest"]
-    
-    for a in autoruns:
+    for a in _AUTORUN_KEYS:
         if a in reg_key:
             return True
 
-    if "\\clsid\\" in reg_key:
-        for c in clsid_run:
-            if reg_key.endswith(c):
-                return True
+    if "\\clsid\\" in reg_key and reg_key.endswith(_CLSID_RUN):
+        return True
     
-    if "\\currentcontrolset" in reg_key and "\\services\\" in reg_key:
-        for s in serv_run:
-            if reg_key.endswith(s):
-                return True
+    if (
+        "\\currentcontrolset" in reg_key
+        and "\\services\\" in reg_key
+        and reg_key.endswith(_SERV_RUN)
+    ):
+        return True
     
     return False
 
@@ -487,12 +510,8 @@ def is_lol_bin(_image_or_filename):
         bool: True if the entry an Lolbin, False if not.
     """
     image_or_filename = str(_image_or_filename).casefold()
-    for bin in LOL_BINS:
-        if bin == image_or_filename:
-            return True
-        if image_or_filename.endswith(f"\\{bin}"):
-            return True
-    return False
+    # A name equal to a LOL bin or a path ending with "\\" and a LOL bin
+    return image_or_filename.rpartition("\\")[2] in _LOL_BIN_SET
 
 def references_lol_bin(_text):
     """
@@ -504,7 +523,10 @@ def references_lol_bin(_text):
         bool: True if the entry an Lolbin, False if not.
     """
     text = str(_text).casefold()
-    for bin in LOL_BINS:
-        if bin in text:
+    # Any LOL bin in the text ends at one of the ".exe" occurrences
+    idx = text.find(".exe")
+    while idx != -1:
+        if text.endswith(_LOL_BIN_NAMES, 0, idx + 4):
             return True
+        idx = text.find(".exe", idx + 4)
     return False
\ No newline at end of file
@@ -1,12 +1,13 @@
 import hashlib
 import re
 import os
+from itertools import islice
 
 from artifacts.parsers.pdf_file import identify_pdf, parse_pdf
 from artifacts.parsers.pe_file import identify_pe, parse_pe
-from artifacts.parsers.mft_file import identify_mft, parse_mft
+from artifacts.parsers.mft_file import identify_mft, parse_mft, iter_mft
 from artifacts.parsers.registry_file import identify_reg, parse_reg
-from artifacts.parsers.evtx_file import identify_evtx, parse_evtx
+from artifacts.parsers.evtx_file import identify_evtx, parse_evtx, iter_evtx
 
 
 class ArtifactParser:
@@ -19,6 +20,11 @@ class ArtifactParser:
             "Windows Registry File": (identify_reg, parse_reg),
             "Windows EVTX File": (identify_evtx, parse_evtx),
         }
+        # Parsers that yield their pages one at a time, used by iter_pages
+        self.streaming_parsers = {
+            "Windows Master File Table": iter_mft,
+            "Windows EVTX File": iter_evtx,
+        }
 
     def parse_file(self, fpath, original_fpath=None):
         """
@@ -36,31 +42,96 @@ class ArtifactParser:
             tuple: A tuple containing the updated file information, strings, and contents. If an
                    exception occurs during parsing, it returns None for all three elements.
         """
-        contents = []
         try:
             file_info, strings, header = self.get_file_info(fpath, original_fpath)
         except Exception as e:
             self.logger.critical(f"parse_file: Parsing file info raised {e}, skipping")
             return None, None, None
-        file_type_string = "Binary File"
+        file_type_string, contents = self.parse_contents(fpath, header)
+        self.remove_file(fpath)
+        file_info["file_type"] = file_type_string
+        return file_info, strings, contents
+
+    def parse_contents(self, fpath, header, streaming=False):
+        """
+        Identifies the type of a file and parses its contents.
+
+        The identifiers of the artifact parsers are tried in order. The parser of the first
+        identified type parses the file, and if it raises, the remaining types are tried. If
+        streaming is set and the identified type has a streaming parser, its generator is
+        returned without parsing the file, otherwise the parsed list of pages is returned.
+
+        Args:
+            fpath (str): The path of the file to be parsed.
+            header (bytes): The pre-read header of the file.
+            streaming (bool, optional): Whether a streaming parser may be returned. Defaults
+                to False.
+
+        Returns:
+            tuple: A tuple containing the file type string and the pages of the file, as a list
+                   or, if streaming is set, possibly as a generator.
+        """
         for file_type, (identifier, parser) in self.artifact_parsers.items():
             try:
                 if identifier(fpath, self.logger, header=header) is True:
+                    if streaming is True and file_type in self.streaming_parsers:
+                        return file_type, self.streaming_parsers[file_type](
+                            fpath, self.logger
+                        )
                     try:
-                        contents = parser(fpath, self.logger)
-                        file_type_string = file_type
-                        break
+                        return file_type, parser(fpath, self.logger)
                     except Exception as e:
                         self.logger.error(f"parse_file: Parser {parser} raised {e}")
             except Exception as e:
                 self.logger.error(f"parse_file: Identifier {identifier} raised {e}")
-        # Remove uploaded file
+        return "Binary File", []
+
+    def remove_file(self, fpath):
+        """
+        Removes an uploaded file once it has been parsed, logging any error.
+
+        Args:
+            fpath (str): The path of the file to be removed.
+        """
         try:
             os.remove(fpath)
         except Exception as e:
             self.logger.error(f"parse_file: Deleting {fpath} raised {e}")
-        file_info["file_type"] = file_type_string
-        return file_info, strings, contents
+
+    def iter_pages(self, fpath, batch=10000, original_fpath=None):
+        """
+        Parses a file and yields its contents in batches of pages.
+
+        EVTX and MFT files are parsed by streaming parsers, so only the current batch of
+        pages is held in memory and each batch is yielded while the rest of the file is still
+        being parsed. The other artifact parsers return all pages of a file as one list, which
+        is then yielded in slices. The uploaded file is removed once all batches have been
+        yielded or the generator is closed.
+
+        Args:
+            fpath (str): The path of the file to be parsed.
+            batch (int, optional): The maximum number of pages per batch. Defaults to 10000.
+            original_fpath (str, optional): The original path of the file if different from fpath.
+
+        Yields:
+            tuple: A tuple containing the file information and a list of pages.
+        """
+        try:
+            file_info, strings, header = self.get_file_info(fpath, original_fpath)
+        except Exception as e:
+            self.logger.critical(f"iter_pages: Parsing file info raised {e}, skipping")
+            return
+        try:
+            file_type_string, pages = self.parse_contents(fpath, header, streaming=True)
+            file_info["file_type"] = file_type_string
+            pages = iter(pages)
+            while True:
+                chunk = list(islice(pages, batch))
+                if not chunk:
+                    break
+                yield file_info, chunk
+        finally:
+            self.remove_file(fpath)
 
     def get_file_info(self, fpath, original_fpath=None):
         """
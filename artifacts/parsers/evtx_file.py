@@ -36,9 +36,7 @@ def parse_evtx(fpath, logger):
     """
     Parses an EVTX file and extracts relevant events.
 
-    This function reads an EVTX file from a given path and uses PyEvtxParser to parse the
-    records. It filters and formats the parsed events, appending them to a result list if they
-    meet certain criteria. Exceptions during parsing are logged but do not stop the process.
+    This function collects the events yielded by iter_evtx into a list.
 
     Args:
         fpath (str): The file path of the EVTX file to be parsed.
@@ -47,18 +45,39 @@ def parse_evtx(fpath, logger):
     Returns:
         list: A list of tuples, each containing a UTC timestamp and formatted event data.
     """
-    result = []
+    return list(iter_evtx(fpath, logger))
+
+
+def iter_evtx(fpath, logger):
+    """
+    Parses an EVTX file and yields relevant events one at a time.
+
+    This function reads an EVTX file from a given path and uses PyEvtxParser to parse the
+    records. It filters and formats the parsed events and yields those that meet certain
+    criteria, so callers can consume large files without holding all events in memory.
+    Exceptions during parsing are logged but do not stop the process.
+
+    Args:
+        fpath (str): The file path of the EVTX file to be parsed.
+        logger (logging.Logger): A logger instance for logging errors and exceptions.
+
+    Yields:
+        tuple: A tuple containing a UTC timestamp and formatted event data.
+    """
     try:
         parser = PyEvtxParser(fpath)
         for record in parser.records_json():
             try:
-                if "data" in record:
-                    data = json.loads(record["data"])
-                    event, utc = filter_evtx_event(data)
-                    if event:
-                        result.append((utc, format_json_for_llm(event)))
+                if "data" not in record:
+                    continue
+                data = json.loads(record["data"])
+                event, utc = filter_evtx_event(data)
+                if not event:
+                    continue
+                page = (utc, format_json_for_llm(event))
             except Exception as e:
                 logger.info(f"parse_evtx: parsing {fpath} page raised {e}")
+                continue
+            yield page
     except Exception as e:
         logger.error(f"parse_evtx: Parsing raised {e}")
-    return result
@@ -39,9 +39,7 @@ def parse_mft(fpath, logger):
     """
     Parses an MFT file and extracts relevant information into a list of tuples.
 
-    This function reads an MFT file from the given path using PyMftParser, processes each entry
-    to gather detailed file information, and formats this data for further analysis. It handles
-    exceptions gracefully by logging errors and continues processing other entries.
+    This function collects the entries yielded by iter_mft into a list.
 
     Args:
         fpath (str): The file path of the MFT file to be parsed.
@@ -50,12 +48,32 @@ def parse_mft(fpath, logger):
 
     Returns:
         list: A list of tuples containing formatted JSON data extracted from the MFT entries.
+    """
+    return list(iter_mft(fpath, logger))
+
+
+def iter_mft(fpath, logger):
+    """
+    Parses an MFT file and yields relevant information one entry at a time.
+
+    This function reads an MFT file from the given path using PyMftParser, processes each entry
+    to gather detailed file information, and formats this data for further analysis. Each kept
+    entry is yielded as soon as it is formatted, so only the file information of the entries
+    not yet reached by the second pass is held in memory. It handles exceptions gracefully by
+    logging errors and continues processing other entries.
+
+    Args:
+        fpath (str): The file path of the MFT file to be parsed.
+        logger (logging.Logger): A logger instance used for logging errors and information during
+            parsing.
+
+    Yields:
+        tuple: A tuple containing a UTC timestamp and formatted JSON data of an MFT entry.
 
     Raises:
         Exception: If an error occurs during file parsing or processing, it is logged but not
             raised to allow continued execution.
     """
-    result = []
     try:
         parser = PyMftParser(fpath)
         file_info_dict = {}
@@ -108,7 +126,6 @@ def parse_mft(fpath, logger):
                 fn_a = ""
                 fn_c = ""
                 fn_e = ""
-                utc = 0.0
                 for attribute in entry["attributes"]:
                     if attribute["header"]["type_code"] == "StandardInformation":
                         si_owner_id = attribute["data"]["owner_id"]
@@ -125,51 +142,51 @@ def parse_mft(fpath, logger):
                         fn_e = attribute["data"]["mft_modified"]
                         total_lsz += fn_logical_size
                         total_psz += fn_physical_size
-                        utc = ts_to_utc(fn_c)
-                if utc == 0.0:
-                    continue
+                # Most entries are filtered by path, only parse the timestamp of kept ones
                 if filter_mft_path(full_path) is False:
                     continue
-                result.append(
-                    (
-                        utc,
-                        format_json_for_llm(
-                            {
-                                "base_entry_id": base_entry_id,
-                                "base_entry_sequence": base_entry_sequence,
-                                "entry_id": entry_id,
-                                "file_size": file_size,
-                                "flags": flags,
-                                "directory": directory,
-                                "full_path": full_path,
-                                "hard_link_count": hard_link_count,
-                                "sequence": sequence,
-                                "total_entry_size": total_entry_size,
-                                "used_entry_size": used_entry_size,
-                                "si_file_flags": si_file_flags,
-                                "si_owner_id": si_owner_id,
-                                "si_m": si_m,
-                                "si_a": si_a,
-                                "si_c": si_c,
-                                "si_e": si_e,
-                                "fn_flags": fn_flags,
-                                "fn_name": fn_name,
-                                "extension": extension,
-                                "fn_logical_size": fn_logical_size,
-                                "fn_physical_size": fn_physical_size,
-                                "fn_m": fn_m,
-                                "fn_a": fn_a,
-                                "fn_c": fn_c,
-                                "fn_e": fn_e,
-                            }
-                        ),
-                    )
+                utc = ts_to_utc(fn_c)
+                if utc == 0.0:
+                    continue
+                page = (
+                    utc,
+                    format_json_for_llm(
+                        {
+                            "base_entry_id": base_entry_id,
+                            "base_entry_sequence": base_entry_sequence,
+                            "entry_id": entry_id,
+                            "file_size": file_size,
+                            "flags": flags,
+                            "directory": directory,
+                            "full_path": full_path,
+                            "hard_link_count": hard_link_count,
+                            "sequence": sequence,
+                            "total_entry_size": total_entry_size,
+                            "used_entry_size": used_entry_size,
+                            "si_file_flags": si_file_flags,
+                            "si_owner_id": si_owner_id,
+                            "si_m": si_m,
+                            "si_a": si_a,
+                            "si_c": si_c,
+                            "si_e": si_e,
+                            "fn_flags": fn_flags,
+                            "fn_name": fn_name,
+                            "extension": extension,
+                            "fn_logical_size": fn_logical_size,
+                            "fn_physical_size": fn_physical_size,
+                            "fn_m": fn_m,
+                            "fn_a": fn_a,
+                            "fn_c": fn_c,
+                            "fn_e": fn_e,
+                        }
+                    ),
                 )
             except Exception as e:
                 logger.info(f"parse_mft: Parsing {fpath} page raised {e}")
+                continue
+            yield page
     except Exception as e:
         logger.error(f"parse_mft: Parsing raised {e}")
-    return result
 
 
 def get_info_dict_entry(entry_or_error):
@@ -12,7 +12,7 @@ from werkzeug.utils import secure_filename
 
 from utils.utils import read_llm_config
 from modules.frag import FRAG
-from modules.obj import QueryStateManager, ArtifactStateManager
+from modules.obj import query_state_manager, artifact_state_manager
 from views.query_views import data_query, stream_query
 from views.config_views import update_config, get_artifact_files, monitor_parse_progress, parse_upload_folder, delete_vector_db
 
@@ -42,13 +42,6 @@ def create_ui_service(logger):
     # FRAG object is a wrapper around the Vector DB object that handles artifacts
     frag = FRAG(logger)
 
-    # Query State Manager Object
-    # - tracks LLM query status
-    query_state_manager = QueryStateManager()
-
-    # Artifact State Manager Object
-    artifact_state_manager = ArtifactStateManager()
-
     @app.route("/delete_db", methods=["GET"])
     def api_delete_db():
         try:
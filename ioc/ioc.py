@@ -1,3 +1,6 @@
+import functools
+
+
 class IOC:
 
     def __init__(self):
@@ -14,6 +17,15 @@ class IOC:
             "TA0010": self.TA0010(),
             "TA0011": self.TA0011(),
         }
+        # Case folded IOC strings per tactic, deduplicated in their original order
+        self.folded_ioc = {
+            tactic: tuple(
+                dict.fromkeys(
+                    str(ioc_string).casefold() for ioc_string in entry["ioc_strings"]
+                )
+            )
+            for tactic, entry in self.ioc.items()
+        }
 
     def get_ioc_dict(self):
         """
@@ -46,6 +58,23 @@ class IOC:
             return entry["ioc_strings"]
         return []
 
+    def get_folded_tactic_ioc(self, tactic):
+        """
+        Retrieves the case folded IOC strings for a given tactic.
+
+        The IOC strings are case folded and deduplicated once when the instance is built, so
+        callers matching them against case folded text do not have to fold them again on
+        every query.
+
+        Args:
+            tactic (str): The tactic for which to retrieve IOC strings.
+
+        Returns:
+            tuple: The case folded IOC strings associated with the specified tactic or an empty
+                tuple if no IOC strings are found.
+        """
+        return self.folded_ioc.get(tactic, ())
+
     def TA0001(self):
         """
         Returns a dictionary containing information about initial access techniques used by adversaries to gain a
@@ -608,3 +637,17 @@ Exfiltration consists of techniques that adversaries may use to steal data from
 Command and Control consists of techniques that adversaries may use to communicate with systems under their control within a victim network. Adversaries commonly attempt to mimic normal, expected traffic to avoid detection. There are many ways an adversary can establish command and control with various levels of stealth depending on the victim’s network structure and defenses.""",
             "ioc_strings": ["9000", "9001", "9030", "tor.exe"],
         }
+
+
+@functools.lru_cache(maxsize=1)
+def load_ioc():
+    """
+    Returns a process-wide IOC instance, building it on first use.
+
+    The IOC tables are static, so they are parsed once and shared by every FRAG instance
+    and query instead of being rebuilt on each call.
+
+    Returns:
+        IOC: The shared IOC instance.
+    """
+    return IOC()
@@ -1,10 +1,10 @@
 import time
+import queue
 import threading
 import shutil
-from ioc.ioc import IOC
+from ioc.ioc import load_ioc
 from modules.vdb import VectorDB
 from artifacts.file_parser import ArtifactParser
-from utils.utils import chunk_list
 
 
 class FRAG(object):
@@ -14,6 +14,9 @@ class FRAG(object):
         self.instance_name = instance_name
         self.data_path = f"data/FRAG_INDEX_{self.instance_name}"
         self.lock = threading.RLock()
+        self._writer_q = queue.Queue(maxsize=4)
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
         self.connect_db()
 
     def connect_db(self):
@@ -39,9 +42,11 @@ class FRAG(object):
         """
         Drops the database and closes the connection.
 
-        This method acquires a lock to ensure thread safety while dropping the database. It then
-        closes the database connection and deletes the reference to the virtual database (vdb).
+        This method first waits until the writer thread has added every queued batch, and then
+        acquires a lock to ensure thread safety while dropping the database. It then closes the
+        database connection and deletes the reference to the virtual database (vdb).
         """
+        self._writer_q.join()
         with self.lock:
             self.vdb.drop_db()
             self.vdb.close()
@@ -94,18 +99,16 @@ class FRAG(object):
             int: The number of pages added to the database.
         """
         now = round(time.time(), 3)
-        obj = IOC()
-        ioc = obj.get_ioc_dict()
-        ioc_list = []
-        meta_list = []
-        for tid, tobj in ioc.items():
-            name = tobj.get("name")
-            description = tobj.get("description")
-            ioc_string_list = tobj.get("ioc_strings")
-            ioc_string = "\n".join(ioc_string_list)
-            page = f"{tid} - {name}:\n{description}\n\n{ioc_string}"
-            ioc_list.append((now, page))
-            meta_list.append({"tactic": tid})
+        ioc = load_ioc().get_ioc_dict()
+        ioc_list = [
+            (
+                now,
+                f"{tid} - {tobj.get('name')}:\n{tobj.get('description')}\n\n"
+                + "\n".join(tobj.get("ioc_strings")),
+            )
+            for tid, tobj in ioc.items()
+        ]
+        meta_list = [{"tactic": tid} for tid in ioc]
         file_info = {
             "file_type": "IOC",
             "filepath": "",
@@ -120,48 +123,89 @@ class FRAG(object):
             shards_added = self.vdb.add_pages(ioc_list, file_info, prompts=True)
         return pages_added
 
+    def _writer_loop(self):
+        """
+        Drains the writer queue and adds each batch of pages to the database.
+
+        This method runs in a background thread for the lifetime of the instance. Each queue
+        entry is a tuple of a job dictionary, a list of pages and the file information of the
+        artifact. The write lock is acquired once on the first batch of a job and held until
+        the end of the job, so a file is added with a single lock acquisition, and the number
+        of shards added is accumulated in the job. If adding a batch raises, the exception is
+        stored in the job and the remaining batches of that job are skipped. An entry without
+        pages marks the end of a job, releases the lock and sets its done event so that the
+        producer can return. Any exception is caught, so the thread never exits and leaves a
+        producer waiting.
+        """
+        while True:
+            job, chunk, file_info = self._writer_q.get()
+            try:
+                if chunk is None:
+                    if job["locked"] is True:
+                        job["locked"] = False
+                        self.lock.release()
+                    job["done"].set()
+                    continue
+                if job["error"] is not None:
+                    continue
+                if job["locked"] is False:
+                    self.lock.acquire()
+                    job["locked"] = True
+                job["shards_added"] += self.vdb.add_pages(chunk, file_info)
+            except BaseException as e:
+                job["error"] = e
+            finally:
+                self._writer_q.task_done()
+
     def add_file(self, fpath):
         """
         Adds a file to the database and logs relevant information.
 
-        This method parses the specified file using an ArtifactParser instance, measures the
-        time taken for parsing, and logs debug information about the process. It then adds
-        the parsed contents to the database in chunks of 10,000 entries, logging progress
-        and performance metrics such as elapsed time and events per second (eps). The method
-        returns the total number of pages added.
+        This method parses the specified file through an ArtifactParser instance, which hands
+        back batches of 10,000 entries, and queues each batch for the background writer
+        thread, which holds the write lock from the first batch until the end of the file.
+        EVTX and MFT files are parsed while earlier batches are added, and the bounded queue
+        limits how many parsed batches are held in memory. The end of the file is always queued, even
+        if parsing raises, and the method waits for the writer to finish the file. An
+        exception raised by the writer while adding a batch is raised again here.
+        Otherwise, it logs performance metrics such as elapsed time and events per second
+        (eps) and returns the total number of pages added.
 
         Args:
             fpath (str): The file path of the artifact to be parsed and added.
 
         Returns:
             int: The total number of pages added to the database.
+
+        Raises:
+            Exception: If parsing the file or adding one of its batches raised.
         """
         ap = ArtifactParser(self.logger)
         t0 = time.time()
-        file_info, strings, contents = ap.parse_file(fpath)
-        parse_elapsed = round(time.time() - t0, 1)
+        pages_added = 0
+        job = {
+            "shards_added": 0,
+            "error": None,
+            "locked": False,
+            "done": threading.Event(),
+        }
+        try:
+            for file_info, chunk in ap.iter_pages(fpath, 10000):
+                self.logger.debug(
+                    f"Adding chunk with {len(chunk):,} entries for artifact file {fpath}"
+                )
+                self._writer_q.put((job, chunk, file_info))
+                pages_added += len(chunk)
+        finally:
+            self._writer_q.put((job, None, None))
+            job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+        elapsed = max(time.time() - t0, 0.001)
+        eps = round(pages_added / elapsed)
         self.logger.debug(
-            f"Parsing file {fpath} took {parse_elapsed:,} seconds for {len(contents):,} events"
+            f"Added {job['shards_added']:,} shards and {pages_added:,} pages in {round(elapsed)} seconds @ {eps:,} ep/s"
         )
-        pages = []
-        if contents:
-            pages = contents
-        t0 = time.time()
-        self.logger.debug(f"Adding a total of {len(pages):,} for artifact file {fpath}")
-        pages_added = 0
-        shards_added = 0
-        for chunk in chunk_list(pages, 10000):
-            self.logger.debug(
-                f"Adding chunk with {len(chunk):,} entries for artifact file {fpath}"
-            )
-            with self.lock:
-                shards_added += self.vdb.add_pages(chunk, file_info)
-            pages_added += len(chunk)
-            elapsed = time.time() - t0
-            eps = round(pages_added / elapsed)
-            self.logger.debug(
-                f"Added {shards_added:,} shards and {pages_added:,} pages in {round(elapsed)} seconds @ {eps:,} ep/s"
-            )
         return pages_added
 
     def get_artifact_files(self):
@@ -1,9 +1,20 @@
 import time
 import re
 import sys
+import hashlib
 from openai import OpenAI
 import tiktoken
 
+# Token counts for message contents, keyed by model and a digest of the text
+_token_cnt_cache = {}
+_token_cnt_cache_max = 4096
+# tiktoken encodings keyed by model, with the exception raised if loading failed
+_encoding_cache = {}
+# Word and punctuation tokens used by the fallback token estimator
+_token_re = re.compile(
+    "\\b\\w+\\b|[\\.\\,\\!\\?\\;\\:\\-\\—\\(\\)\\[\\]\\{\\}\\\"\\'\\`]"
+)
+
 
 class LLMAPI:
 
@@ -73,7 +84,7 @@ class LLMAPI:
         """
         if "gpt" in self.model:
             try:
-                encoding = tiktoken.encoding_for_model(self.model)
+                encoding = self.get_encoding()
                 return len(encoding.encode(text_string))
             except Exception as e:
                 if self.model_error_triggered is False:
@@ -82,22 +93,123 @@ class LLMAPI:
                         f"get_token_cnt: Loading tokenizer for model {self.model} raised {e}"
                     )
         try:
-            tokens = re.findall(
-                "\\b\\w+\\b|[\\.\\,\\!\\?\\;\\:\\-\\—\\(\\)\\[\\]\\{\\}\\\"\\'\\`]",
-                text_string,
-            )
+            tokens = _token_re.findall(text_string)
         except Exception as e:
             tokens = str(text_string).split(" ")
-        token_cnt = 0
-        for t in tokens:
-            if len(t) > 1:
-                _cnt = len(t) / 1.5
-                if _cnt < 1:
-                    token_cnt += 1
-                else:
-                    token_cnt += round(_cnt)
+        # round(len / 1.5) in integer arithmetic, 2 * len / 3 never ends in .5
+        return sum((2 * len(t) + 1) // 3 for t in tokens if len(t) > 1)
+
+    def get_encoding(self):
+        """
+        Returns the tiktoken encoding of the model, loading it once per process.
+
+        Looking up the encoding of a model on every token count is not free, so encodings are
+        kept in a module level cache keyed by model and shared by all LLMAPI instances. Models
+        unknown to tiktoken are cached as well, so they do not retry the lookup on every
+        call. Other errors, such as a failed download of the encoding, are not cached.
+
+        Returns:
+            tiktoken.Encoding: The encoding of the model.
+
+        Raises:
+            KeyError: If tiktoken has no encoding for the model.
+            Exception: If loading the encoding of the model raised.
+        """
+        entry = _encoding_cache.get(self.model)
+        if entry is None:
+            try:
+                entry = (tiktoken.encoding_for_model(self.model), None)
+            except KeyError as e:
+                entry = (None, e.args)
+            _encoding_cache[self.model] = entry
+        encoding, error = entry
+        if encoding is None:
+            raise KeyError(*error)
+        return encoding
+
+    def get_token_cnts(self, text_strings):
+        """
+        Calculates the token counts of a list of text strings.
+
+        This method looks up the encoding of the model once for the whole list instead of
+        once per text. The counts are the same as those returned by get_token_cnt, texts that
+        cannot be encoded fall back to the regex-based estimate.
+
+        Args:
+            text_strings (list of str): The input text strings to count the tokens of.
+
+        Returns:
+            list of int: The token count of each text string.
+        """
+        if "gpt" in self.model:
+            try:
+                encode = self.get_encoding().encode
+                return [len(encode(text_string)) for text_string in text_strings]
+            except Exception:
+                pass
+        return [self.get_token_cnt(text_string) for text_string in text_strings]
+
+    def get_cached_token_cnt(self, text_string):
+        """
+        Returns the token count of a text string, reusing previously computed counts.
+
+        Message contents such as prompts, chat history and context events are sent again on
+        every query of a RAG pipeline. This method keys their token counts by model and a
+        blake2b digest of the text, so repeated contents are only tokenized once and the
+        cache does not have to hold on to the full strings. The cache is cleared once it
+        holds more than _token_cnt_cache_max entries.
+
+        Args:
+            text_string (str): The input text string for which token count is calculated.
+
+        Returns:
+            int: The total number of tokens in the given text string.
+        """
+        key = (
+            self.model,
+            hashlib.blake2b(
+                str(text_string).encode("utf-8", errors="replace"), digest_size=16
+            ).digest(),
+        )
+        token_cnt = _token_cnt_cache.get(key)
+        if token_cnt is None:
+            token_cnt = self.get_token_cnt(text_string)
+            if len(_token_cnt_cache) >= _token_cnt_cache_max:
+                _token_cnt_cache.clear()
+            _token_cnt_cache[key] = token_cnt
         return token_cnt
 
+    def tokens_exceed(self, text_string, limit):
+        """
+        Checks whether the token count of a text string exceeds a limit.
+
+        Callers that only compare a token count against a limit do not need the exact count.
+        Every token spans at least one byte of the encoded text, so texts that are not longer
+        than the limit are accepted without tokenizing them. For the regex-based fallback the
+        word tokens are counted incrementally and the scan stops as soon as the limit has
+        been crossed.
+
+        Args:
+            text_string (str): The input text string to check.
+            limit (int): The maximum number of tokens allowed.
+
+        Returns:
+            bool: True if the token count of the text string is greater than limit.
+        """
+        if len(text_string) <= limit:
+            if "gpt" not in self.model or len(text_string.encode("utf-8")) <= limit:
+                return False
+        if "gpt" in self.model:
+            return self.get_token_cnt(text_string) > limit
+        token_cnt = 0
+        for m in _token_re.finditer(text_string):
+            t_len = m.end() - m.start()
+            if t_len > 1:
+                token_cnt += (2 * t_len + 1) // 3
+                if token_cnt > limit:
+                    return True
+        return token_cnt > limit
+
     def prune_queries(self, query_list):
         """
         Prunes queries from a list until the total token count is within the context limit.
@@ -114,15 +226,8 @@ class LLMAPI:
         Returns:
             None
         """
-        while True:
-            content_str = ""
-            for entry in query_list:
-                content_str = f"{content_str}{entry[1]}"
-            content_token_len = self.get_token_cnt(content_str)
-            if content_token_len <= self.ctx:
-                break
-            else:
-                _ = query_list.pop(0)
+        while self.tokens_exceed("".join(entry[1] for entry in query_list), self.ctx):
+            _ = query_list.pop(0)
 
     def atomic_query(self, agent_prep, instructions, max_response_ctx=None):
         """
@@ -189,17 +294,16 @@ class LLMAPI:
             client = OpenAI(
                 base_url=self.api_url, api_key=api_key, timeout=self.timeout
             )
-            content_str = ""
+            total_tokens = 0
             if agent_prep:
                 messages = [{"role": "user", "content": agent_prep.strip()}]
-                content_str = f"{agent_prep.strip()}"
+                total_tokens += self.get_cached_token_cnt(agent_prep.strip())
             else:
                 agent_prep = ""
                 messages = []
-            for [role, content] in instructions:
+            for role, content in instructions:
                 messages.append({"role": role, "content": f"{content}\n "})
-                content_str = f"{content_str}{content}"
-            total_tokens = self.get_token_cnt(content_str)
+                total_tokens += self.get_cached_token_cnt(content)
             args = {
                 "model": self.model,
                 "messages": messages,
@@ -227,8 +331,7 @@ class LLMAPI:
                         sys.stdout.write(chunk.choices[0].delta.content)
                         sys.stdout.flush()
                     msg = f"{msg}{chunk.choices[0].delta.content}"
-                    msg_len = self.get_token_cnt(msg)
-                    if msg_len + total_tokens >= max_response_ctx:
+                    if self.tokens_exceed(msg, max_response_ctx - total_tokens - 1):
                         try:
                             completion.response.close()
                         except:
@@ -1,49 +1,89 @@
+import sys
 import time
+import itertools
 import threading
-from utils.utils import obj_cp
+from collections import deque
+from operator import itemgetter
+from types import MappingProxyType
+
+_IDLE = sys.intern("Idle")
+_ACTIVE = sys.intern("Active")
+_now = time.time
+# Markdown fragments surrounding reasoner headers
+_HDR_PRE = "\n###### **"
+_HDR_POST = "**\n"
+# Number of status shards in ArtifactStateManager, must be a power of two
+_ARTIFACT_SHARDS = 16
 
 
 class QueryStateManager(object):
-    _instance = None
+    __slots__ = (
+        "status",
+        "_msg_parts",
+        "_reasoner_parts",
+        "events",
+        "last_update",
+        "query_id",
+        "cancel_flag",
+        "_snapshot",
+        "_status_lock",
+        "_content_lock",
+    )
+
+    def __init__(self):
+        self.status = _IDLE
+        self._msg_parts = []
+        self._reasoner_parts = []
+        self.events = deque()
+        self.last_update = _now()
+        self.query_id = None
+        self.cancel_flag = False
+        self._snapshot = (self.status, self.query_id, self.cancel_flag, self.last_update)
+        self._status_lock = threading.Lock()
+        self._content_lock = threading.Lock()
 
-    def __new__(cls, *args, **kwargs):
+    @property
+    def msg(self):
         """
-        Creates a new instance of QueryStateManager if one does not already exist.
+        Returns the message text accumulated since the last query slice.
 
-        This method ensures that only one instance of QueryStateManager is created by checking
-        the existence of cls._instance. If no instance exists, it creates a new one using
-        the superclass's __new__ method and assigns it to cls._instance. It then returns
-        this instance.
+        The message is stored as a list of parts and only joined into a string when it is
+        read, so appending streamed tokens does not rebuild the whole message every time.
+        Assigning a string replaces the parts with that single string.
 
-        Args:
-            cls (type): The class itself.
-            *args: Variable length argument list.
-            **kwargs: Arbitrary keyword arguments.
+        Returns:
+            str: The current message text.
+        """
+        return "".join(self._msg_parts)
+
+    @msg.setter
+    def msg(self, text):
+        self._msg_parts = [text] if text else []
+
+    @property
+    def reasoner(self):
+        """
+        Returns the reasoner text accumulated since the last query slice.
+
+        The reasoner output is stored as a list of parts and only joined into a string when it
+        is read. Assigning a string replaces the parts with that single string.
 
         Returns:
-            QueryStateManager: The singleton instance of the class.
+            str: The current reasoner text.
         """
-        if not cls._instance:
-            cls._instance = super(QueryStateManager, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
+        return "".join(self._reasoner_parts)
 
-    def __init__(self):
-        self.status = "Idle"
-        self.msg = ""
-        self.reasoner = ""
-        self.events = []
-        self.last_update = time.time()
-        self.query_id = None
-        self.cancel_flag = False
-        self.lock = threading.RLock()
+    @reasoner.setter
+    def reasoner(self, text):
+        self._reasoner_parts = [text] if text else []
 
     def reset_query(self):
         """
         Resets the query state to its initial idle condition.
 
             This method sets various attributes of the object to their default values, indicating
-            that no query is currently being processed. It locks the object using a mutex to ensure
-            thread safety during the reset operation. The status is set to 'Idle', and other relevant
+            that no query is currently being processed. It takes the status and content locks to
+            ensure thread safety during the reset operation. The status is set to 'Idle', and other relevant
             attributes such as message, reasoner, events list, last update time, query ID, and cancel
             flag are reset or cleared.
 
@@ -51,18 +91,35 @@ class QueryStateManager(object):
                 None explicitly raised within this method. However, any exceptions that occur during
                 the execution of this method will propagate upwards.
         """
-        with self.lock:
-            self.status = "Idle"
-            self.msg = ""
-            self.reasoner = ""
-            self.events = []
-            self.last_update = time.time()
+        with self._status_lock, self._content_lock:
+            self.status = _IDLE
+            self._msg_parts = []
+            self._reasoner_parts = []
+            self.events = deque()
             self.query_id = None
             self.cancel_flag = False
+            self._touch()
+
+    def _touch(self):
+        """
+        Updates the last update time and publishes a new status snapshot.
+
+        The status lock must be held by the caller. The last update time is only written
+        here, and the time is taken while holding the lock, so it never goes backwards
+        between updates and the snapshot always carries the time of the latest status or
+        content update.
+        """
+        now = _now()
+        self.last_update = now
+        self._snapshot = (self.status, self.query_id, self.cancel_flag, now)
 
     def is_status_cancelled(self):
         """
-        Checks whether the status is cancelled by acquiring a lock and inspecting the cancel flag.
+        Checks whether the status is cancelled by inspecting the cancel flag.
+
+        The cancel flag is only ever assigned while holding the status lock, and loading a
+        single attribute is atomic, so the flag is read without taking the lock. This keeps
+        the cancellation poll of the query workers cheap.
 
         Args:
             self (object): The instance of the class containing the method.
@@ -70,57 +127,61 @@ class QueryStateManager(object):
         Returns:
             bool: True if the status is cancelled, False otherwise.
         """
-        with self.lock:
-            return self.cancel_flag
+        return self.cancel_flag
 
     def is_status_idle(self):
         """
         Checks if the status is idle.
 
-        This function acquires a lock and checks whether the current status is 'Idle'. It
-        returns True if the status is 'Idle', otherwise it returns False.
+        This function checks whether the current status is 'Idle' without taking the lock, as
+        the status is only assigned while holding the status lock. Status strings are interned,
+        so the check is an identity comparison. It returns True if the status is 'Idle',
+        otherwise it returns False.
 
         Returns:
             bool: True if the status is 'Idle', otherwise False.
         """
-        with self.lock:
-            return self.status == "Idle"
+        return self.status is _IDLE
 
     def get_status(self):
         """
         Returns the status of the object while ensuring thread safety.
 
-        This method acquires a lock to safely access and return the current status of the
-        object. The lock ensures that only one thread can read the status at a time,
-        preventing any race conditions.
+        The status is only assigned while holding the status lock and is returned with a
+        single attribute load, so no lock is needed to read it.
 
         Returns:
             Any: The current status of the object.
         """
-        with self.lock:
-            return self.status
+        return self.status
 
     def set_status_cancelled(self):
         """
         Sets the status of an object to 'Cancelled'.
 
         This method updates the last update time, sets a cancel flag to True, and changes the
-        status to 'Idle' while ensuring thread safety using a lock.
+        status to 'Idle' while ensuring thread safety using a lock. Repeated calls return
+        without taking the lock when the query is already cancelled and idle; the check is
+        repeated under the lock.
 
         Args:
             self (object): The instance of the class containing this method.
         """
-        with self.lock:
-            self.last_update = time.time()
+        if self.cancel_flag is True and self.status is _IDLE:
+            return
+        with self._status_lock:
+            if self.cancel_flag is True and self.status is _IDLE:
+                return
             self.cancel_flag = True
-            self.status = "Idle"
+            self.status = _IDLE
+            self._touch()
 
     def set_status_idle(self):
         """
         Sets the status of an object to 'Idle' and updates the last update time.
 
         This method acquires a lock to ensure thread safety while updating the status and
-        last update time. The self.lock is used to synchronize access to shared resources,
+        last update time. The status lock is used to synchronize access to shared resources,
         ensuring that only one thread can modify the object's state at a given time.
 
         Args:
@@ -129,19 +190,18 @@ class QueryStateManager(object):
         Raises:
             None
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.status = "Idle"
+        with self._status_lock:
+            self.status = _IDLE
+            self._touch()
 
     def set_status_active(self):
         """
         Sets the status of an object to 'Active' and updates the last update time.
 
         This method acquires a lock to ensure thread safety while updating the status and
-        last update time. The self.lock is used to synchronize access, ensuring that only one
-        thread can modify these attributes at a given time. After acquiring the lock, it sets
-        the self.status attribute to 'Active' and updates self.last_update with the current
-        time using time.time().
+        last update time. The status lock is used to synchronize access, ensuring that only one
+        thread can modify these attributes at a given time. While holding the lock, it sets
+        the self.status attribute to 'Active' and updates self.last_update.
 
         Args:
             self (object): The instance of the class containing this method.
@@ -149,17 +209,18 @@ class QueryStateManager(object):
         Raises:
             None
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.status = "Active"
+        with self._status_lock:
+            self.status = _ACTIVE
+            self._touch()
 
     def set_status(self, status):
         """
         Sets the status of an object and updates the last update time.
 
         This method acquires a lock to ensure thread safety while updating the status and
-        last update time of the object. The status is set to the provided string value, and
-        the last update time is set to the current time.
+        last update time of the object. The status is set to the interned provided string
+        value, so that is_status_idle can compare it by identity, and the last update time is
+        set to the current time.
 
         Args:
             self (object): The instance of the class containing this method.
@@ -168,29 +229,45 @@ class QueryStateManager(object):
         Raises:
             None
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.status = f"{status}"
+        status = sys.intern(status)
+        with self._status_lock:
+            self.status = status
+            self._touch()
+
+    def get_snapshot(self):
+        """
+        Returns a consistent snapshot of the query status fields without taking the lock.
+
+        Every status and content mutator publishes a new tuple with the status, query ID,
+        cancel flag and the time of the update at the end of its critical section. Replacing the tuple is a single
+        attribute store, so readers always see the fields of one update together, even if
+        the snapshot may already be stale when it is used.
+
+        Returns:
+            tuple: A tuple of (status, query_id, cancel_flag, last_update).
+        """
+        return self._snapshot
 
     def get_query_id(self):
         """
         Returns the query ID associated with the object.
 
-        This method acquires a lock to ensure thread safety and returns the current query ID.
+        The query ID is only assigned while holding the status lock and is returned with a
+        single attribute load, so no lock is needed to read it.
 
         Returns:
             The query ID as an integer or other appropriate type.
         """
-        with self.lock:
-            return self.query_id
+        return self.query_id
 
     def append_reasoner_header(self, text):
         """
         Appends a header to the reasoner text with the specified message.
 
         This method acquires a lock to ensure thread safety while updating the last update time
-        and appending a formatted header to the existing reasoner text. The header includes the
-        provided text enclosed in markdown-style bold and newline characters.
+        and appending the header to the reasoner parts list. The header is added as the fixed
+        _HDR_PRE and _HDR_POST fragments around the provided text, which enclose it in
+        markdown-style bold and newline characters.
 
         Args:
             text (str): The message to be included in the header.
@@ -198,47 +275,62 @@ class QueryStateManager(object):
         Returns:
             None
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.reasoner = f"{self.reasoner}\n###### **{text}**\n"
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._reasoner_parts.extend((_HDR_PRE, str(text), _HDR_POST))
 
     def append_msg_header(self, text):
         """
         Appends a message header to the existing message with a timestamp update.
 
         This method acquires a lock to ensure thread safety while updating the last_update time
-        and appending text to the current message. The new text is added as a new line to the
-        existing message.
+        and appending text to the message parts list. The new text is added as a new line to
+        the existing message.
 
         Args:
             text (str): The text to be appended to the existing message.
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.msg = f"{self.msg}\n{text}"
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._msg_parts.extend(("\n", str(text)))
 
     def append_reasoner_text(self, text):
         """
         Appends additional text to the reasoner's output while ensuring thread safety.
 
-        This method updates the last update time and appends the given text to the existing
-        reasoner text in a thread-safe manner by using a lock. The resulting reasoner text is
-        a concatenation of the current reasoner text and the provided text.
+        This method updates the last update time and appends the given text to the reasoner
+        parts list in a thread-safe manner by using a lock. The parts are joined into a single
+        string when the query slice is taken.
 
         Args:
             self (object): The instance of the class containing this method.
             text (str): The additional text to be appended to the reasoner's output.
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.reasoner = f"{self.reasoner}{text}"
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._reasoner_parts.append(str(text))
+
+    def append_reasoner_texts(self, texts):
+        """
+        Appends several chunks of text to the reasoner's output, taking the locks once.
+
+        This method is meant for streaming producers that buffer tokens and hand them over in
+        batches, so that the locks are taken once per batch rather than once per token.
+
+        Args:
+            self (object): The instance of the class containing this method.
+            texts (iterable): The chunks of text to be appended to the reasoner's output.
+        """
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._reasoner_parts.extend(str(text) for text in texts)
 
     def append_msg_text(self, text):
         """
         Appends a message text to an existing message while ensuring thread safety.
 
-        This method updates the last update time and appends the given text to the current
-        message in a thread-safe manner by acquiring a lock before making any changes.
+        This method updates the last update time and appends the given text to the message
+        parts list in a thread-safe manner by acquiring a lock before making any changes.
 
         Args:
             self (object): The instance of the class containing this method.
@@ -247,119 +339,180 @@ class QueryStateManager(object):
         Returns:
             None
         """
-        with self.lock:
-            self.last_update = time.time()
-            self.msg = f"{self.msg}{text}"
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._msg_parts.append(str(text))
+
+    def append_msg_texts(self, texts):
+        """
+        Appends several chunks of text to the message, taking the locks once.
+
+        This method is meant for streaming producers that buffer tokens and hand them over in
+        batches, so that the locks are taken once per batch rather than once per token.
+
+        Args:
+            self (object): The instance of the class containing this method.
+            texts (iterable): The chunks of text to be appended to the existing message.
+
+        Returns:
+            None
+        """
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self._msg_parts.extend(str(text) for text in texts)
 
     def append_event(self, event):
         """
-        Appends an event to the events list and updates the last update time.
+        Appends an event to the events deque and updates the last update time.
 
         This method acquires a lock before appending the event to ensure thread safety. It also
         updates the last_update attribute with the current time using time.time().
 
         Args:
             self (object): The instance of the class containing this method.
-            event (object): The event object to be appended to the events list.
+            event (object): The event object to be appended to the events deque.
         """
-        with self.lock:
-            self.last_update = time.time()
+        with self._status_lock, self._content_lock:
+            self._touch()
             self.events.append(event)
 
+    def append_events(self, events):
+        """
+        Appends several events to the events deque, taking the locks once.
+
+        This method updates the last_update attribute with the current time and extends the
+        events deque while holding the status and content locks once for the whole batch.
+
+        Args:
+            self (object): The instance of the class containing this method.
+            events (iterable): The event objects to be appended to the events deque.
+        """
+        with self._status_lock, self._content_lock:
+            self._touch()
+            self.events.extend(events)
+
     def get_query_slice(self):
         """
         Retrieves a query slice from the current state of the object.
 
-        This method acquires a lock to ensure thread safety while accessing and modifying
-        shared resources. It constructs a dictionary representing the current query state,
-        including status, message, reasoner, events, last update, query ID, and cancel flag.
-        The method then creates a copy of this dictionary and resets certain attributes (events,
-        reasoner, msg) to their default values before returning the copied dictionary.
+        This method acquires the status and content locks, in that order, only long enough
+        to take the message, reasoner and events buffers by reference and replace them with
+        empty ones, so the caller becomes the sole owner of the returned objects and no copy
+        is needed. The dictionary with status, message, reasoner, events, last update, query
+        ID, and cancel flag is then built outside of the locks, joining the message and reasoner parts into strings and
+        turning the events deque into a list.
 
         Returns:
             dict: A dictionary containing the current state of the query.
         """
-        with self.lock:
-            query_state_dict = {
-                "status": self.status,
-                "msg": self.msg,
-                "reasoner": self.reasoner,
-                "events": self.events,
-                "last_update": self.last_update,
-                "query_id": self.query_id,
-                "cancel_flag": self.cancel_flag,
-            }
-            ret_val = obj_cp(query_state_dict)
-            self.events = []
-            self.reasoner = ""
-            self.msg = ""
-            return ret_val
+        with self._status_lock, self._content_lock:
+            status = self.status
+            msg_parts = self._msg_parts
+            reasoner_parts = self._reasoner_parts
+            events = self.events
+            last_update = self.last_update
+            query_id = self.query_id
+            cancel_flag = self.cancel_flag
+            self.events = deque()
+            self._reasoner_parts = []
+            self._msg_parts = []
+        return {
+            "status": status,
+            "msg": "".join(msg_parts),
+            "reasoner": "".join(reasoner_parts),
+            "events": list(events),
+            "last_update": last_update,
+            "query_id": query_id,
+            "cancel_flag": cancel_flag,
+        }
 
 
 class ArtifactStateManager(object):
-    _instance = None
+    __slots__ = ("_shards", "_seq")
+
+    def __init__(self):
+        self._shards = [({}, threading.Lock()) for _ in range(_ARTIFACT_SHARDS)]
+        self._seq = itertools.count()
 
-    def __new__(cls, *args, **kwargs):
+    def _shard(self, filepath):
         """
-        Creates a new instance of the class if one does not already exist.
+        Returns the status shard responsible for a file path.
 
-        This method ensures that only one instance of the class is created by checking if an
-        instance already exists before creating a new one. If no instance exists, it calls
-        the superclass's __new__ method to create and return a new instance. Otherwise, it
-        returns the existing instance.
+        The file status entries are spread over _ARTIFACT_SHARDS dictionaries, each guarded by
+        its own lock, so that updates of unrelated files do not contend for a single lock.
 
         Args:
-            cls (type): The class itself.
-            *args: Variable length argument list.
-            **kwargs: Arbitrary keyword arguments.
+            filepath (str): The path of the file.
 
         Returns:
-            An instance of the class.
+            tuple: The status dictionary and the lock of the shard.
         """
-        if not cls._instance:
-            cls._instance = super(ArtifactStateManager, cls).__new__(
-                cls, *args, **kwargs
-            )
-        return cls._instance
+        return self._shards[hash(filepath) & (_ARTIFACT_SHARDS - 1)]
 
-    def __init__(self):
-        self.lock = threading.RLock()
-        self.status = {}
+    def _set_file_status(self, filepath, status):
+        """
+        Sets the status of a file in its shard.
+
+        Each entry keeps the sequence number from when the file was first added, so that
+        get_status can return the files in the order they were added.
+
+        Args:
+            filepath (str): The path of the file.
+            status (str): The new status of the file.
+        """
+        status_map, lock = self._shard(filepath)
+        with lock:
+            entry = status_map.get(filepath)
+            seq = entry[0] if entry is not None else next(self._seq)
+            status_map[filepath] = (seq, {"status": status})
 
     def get_status(self):
         """
         Returns the status of the object while ensuring thread safety.
 
-        This method acquires a lock to safely access and return the current status of the
-        object. The lock ensures that only one thread can read the status at a time,
-        preventing race conditions.
+        This method acquires the locks of all shards in a fixed order, collects their entries
+        and merges them into a single dictionary ordered by the time each file was first
+        added. The snapshot is returned as a read-only MappingProxyType, so callers cannot
+        modify it and no defensive copy is needed.
 
         Returns:
-            The current status of the object.
-        """
-        with self.lock:
-            return self.status
+            MappingProxyType: The current status of the object.
+        """
+        for _, lock in self._shards:
+            lock.acquire()
+        try:
+            entries = [
+                (seq, filepath, status)
+                for status_map, _ in self._shards
+                for filepath, (seq, status) in status_map.items()
+            ]
+        finally:
+            for _, lock in reversed(self._shards):
+                lock.release()
+        entries.sort(key=itemgetter(0))
+        return MappingProxyType(
+            {filepath: status for _, filepath, status in entries}
+        )
 
     def add_file(self, filepath):
         """
         Adds a file to the processing queue with an initial status of 'queued'.
 
         This method updates the internal state to reflect that a new file has been added for
-        processing. It uses a lock to ensure thread safety when modifying shared resources.
+        processing. Only the lock of the shard holding the file is taken.
 
         Args:
             self (object): The instance of the class containing this method.
             filepath (str): The path to the file being added to the queue.
         """
-        with self.lock:
-            self.status[filepath] = {"status": "queued"}
+        self._set_file_status(filepath, "queued")
 
     def mark_file_in_progress(self, filepath):
         """
         Marks a file as being in progress by updating its status in the internal dictionary.
 
-        This method acquires a lock to ensure thread safety while updating the status of
-        the specified file. The status is set to 'in-progress' for the given filepath.
+        This method acquires the lock of the shard holding the file while updating the status
+        of the specified file. The status is set to 'in-progress' for the given filepath.
 
         Args:
             filepath (str): The path of the file to be marked as in progress.
@@ -367,16 +520,15 @@ class ArtifactStateManager(object):
         Returns:
             None
         """
-        with self.lock:
-            self.status[filepath] = {"status": "in-progress"}
+        self._set_file_status(filepath, "in-progress")
 
     def mark_file_done(self, filepath):
         """
         Marks a file as done by updating its status.
-        
+
         This function updates the status of a specified file to 'done' in a thread-safe manner
-        using a lock. It modifies the internal dictionary self.status to reflect that the
-        file has been processed successfully.
+        using the lock of the shard holding the file, to reflect that the file has been
+        processed successfully.
 
         Args:
             filepath (str): The path of the file to be marked as done.
@@ -384,18 +536,14 @@ class ArtifactStateManager(object):
         Raises:
             None
         """
-        with self.lock:
-            self.status[filepath] = {"status": "done"}
+        self._set_file_status(filepath, "done")
 
     def mark_file_deleted(self, filepath):
         """
-        Marks a file as deleted by removing its entry from the status dictionary and resetting
-        the dictionary if it becomes empty.
+        Marks a file as deleted by removing its entry from the status dictionary.
 
-        This method acquires a lock to ensure thread safety while modifying the shared state.
-        It removes the specified filepath from the status dictionary, and if the dictionary
-        becomes empty after removal, it resets the dictionary to None and then reinitializes it
-        as an empty dictionary.
+        This method acquires the lock of the shard holding the file while removing the
+        specified filepath from the shard.
 
         Args:
             filepath (str): The path of the file to be marked as deleted.
@@ -403,9 +551,13 @@ class ArtifactStateManager(object):
         Raises:
             KeyError: If the specified filepath is not found in the status dictionary.
         """
-        with self.lock:
-            del self.status[filepath]
-            if len(self.status) == 0:
-                self.status = None
-                del self.status
-                self.status = {}
+        status_map, lock = self._shard(filepath)
+        with lock:
+            del status_map[filepath]
+
+
+# Process-wide state managers, constructed once at import
+# - tracks LLM query status
+query_state_manager = QueryStateManager()
+# - tracks artifact parsing progress
+artifact_state_manager = ArtifactStateManager()
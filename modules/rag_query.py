@@ -1,13 +1,170 @@
+import io
 import time
-import json
+import re
+import orjson
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import islice
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from utils.utils import (
     read_prompt,
     ret_time,
     indent_string,
     trunc_sysmon_event,
     ts_to_utc,
+    obj_cp,
 )
-from ioc.ioc import IOC
+from ioc.ioc import load_ioc
+from modules.llm_api import LLMAPI
+
+# Streaming loops poll for cancellation once every 32 tokens
+_CANCEL_CHECK_MASK = 31
+# Document filter operators of generated conditions
+_CONTAINS = "$contains"
+_OR = "$or"
+# Characters stripped from the words of generated conditions
+_STRIP_CHARS = " \t.'\"\\`"
+# Lines containing a backtick, such as markdown code fences around JSON output
+_BACKTICK_LINE_RE = re.compile(r"^[^\n]*`[^\n]*\n?", re.M)
+# Words and patterns hinting at a time range, queries without any skip time range extraction
+_TIME_HINT_RE = re.compile(
+    r"\d{1,2}[:/]\d{1,2}|\d{1,2}\s*[ap]\.?m\b|\d+\s*(?:[smhdwy]|mo|ms)\b"
+    r"|\b(?:\d{4}|\d{1,2}(?:st|nd|rd|th)|q[1-4]|h[12]|fy\d{0,4}"
+    r"|jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+    r"|mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:rs(?:day)?)?|fri(?:day)?"
+    r"|sat(?:urday)?|sun(?:day)?|yesterday|today|tonight|now|recent(?:ly)?|ago|last"
+    r"|past|previous|since|until|between|before|after|during|from|morning|afternoon"
+    r"|evening|night|overnight|noon|midnight|weekend|earlier|latest|quarter(?:ly)?"
+    r"|(?:second|minute|hour|day|week|month|year|sec|min|hr|wk|yr)s?"
+    r"|hourly|daily|weekly|monthly|yearly|annual(?:ly)?|period|window"
+    r"|utc|date|time(?:frame|line|range|stamp)?s?)\b",
+    re.I,
+)
+
+# LRU cache of expanded queries and IOC conditions shared by all RAGQuery instances
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+_query_cache_max = 64
+
+
+def _fold(text):
+    """
+    Case folds a string, taking the faster lower() path for ASCII strings.
+
+    Args:
+        text (str): The string to case fold.
+
+    Returns:
+        str: The case folded string.
+    """
+    return text.lower() if text.isascii() else text.casefold()
+
+
+def query_cache_key(*parts):
+    """
+    Builds a cache key for the shared query cache from a list of strings.
+
+    Args:
+        *parts (str): The strings identifying the cached result, such as the model name, the
+            kind of result and the query text.
+
+    Returns:
+        str: The SHA1 hex digest of the NUL separated parts.
+    """
+    return hashlib.sha1(
+        "\x00".join(parts).encode("utf-8", errors="replace")
+    ).hexdigest()
+
+
+def query_cache_get(key):
+    """
+    Returns a cached result and marks it as most recently used.
+
+    Args:
+        key (str): The cache key built with query_cache_key.
+
+    Returns:
+        The cached value, or None if the key is not cached.
+    """
+    with _query_cache_lock:
+        value = _query_cache.get(key)
+        if value is not None:
+            _query_cache.move_to_end(key)
+        return value
+
+
+def query_cache_put(key, value):
+    """
+    Stores a result in the shared query cache, evicting the least recently used entries
+    once more than _query_cache_max results are cached.
+
+    Args:
+        key (str): The cache key built with query_cache_key.
+        value (Any): The result to cache.
+    """
+    with _query_cache_lock:
+        _query_cache[key] = value
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > _query_cache_max:
+            _query_cache.popitem(last=False)
+
+
+def _log_append(reasoner_log, append, value):
+    """
+    Records a reasoner update in a reasoner log instead of applying it.
+
+    Args:
+        reasoner_log (list): The list the update is appended to.
+        append (callable): The query state manager method that applies the update on replay.
+        value (str or list of str): The argument of the method.
+
+    Returns:
+        None
+    """
+    reasoner_log.append((append, value))
+
+
+class TokenBuffer:
+
+    def __init__(self, append_texts, max_chars=128, max_delay=0.05):
+        self.append_texts = append_texts
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.parts = []
+        self.buf_len = 0
+        self.last_flush = time.monotonic()
+
+    def append(self, token):
+        """
+        Buffers a streamed token and flushes the buffer when it is full or stale.
+
+        Tokens are collected until at least max_chars characters are buffered or more than
+        max_delay seconds have passed since the last flush, so the query state manager is
+        updated once per batch of tokens instead of once per token.
+
+        Args:
+            token (str): The streamed token to buffer.
+        """
+        self.parts.append(token)
+        self.buf_len += len(token)
+        if (
+            self.buf_len >= self.max_chars
+            or time.monotonic() - self.last_flush > self.max_delay
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Hands all buffered tokens to the append callback in a single call.
+        """
+        if self.parts:
+            self.append_texts(self.parts)
+            self.parts = []
+            self.buf_len = 0
+        self.last_flush = time.monotonic()
 
 
 class RAGQuery:
@@ -22,6 +179,8 @@ class RAGQuery:
         self.llm_config = llm_config
         self.logger = logger
         self.verbose_reasoner = True
+        # Date time group shared by all prompts of a query, refreshed by execute
+        self._dtg = ret_time(time.time())
 
     def execute(self):
         """
@@ -30,7 +189,9 @@ class RAGQuery:
         This function retrieves configuration settings from query_dict, generates queries using
         generate_rag_query, and checks for cancellation signals before proceeding. It prunes the
         queries, sets status messages, and sends them to an LLM API while monitoring for cancellation
-        signals throughout the process. If a cancellation signal is received at any point, it logs a
+        signals throughout the process. Streamed tokens are handed to the query state manager in
+        batches through a TokenBuffer, and cancellation is polled every 32 tokens and once more
+        after the stream ends. If a cancellation signal is received at any point, it logs a
         warning and updates the query state manager accordingly. The function iterates through tokens
         from the LLM API response until a sufficient length is reached or if cancelled. Upon completion,
         it sets the status to idle and appends final messages to the query state manager.
@@ -42,6 +203,7 @@ class RAGQuery:
             None explicitly raised but handles cancellation signals gracefully.
         """
         self.verbose_reasoner = self.query_dict.get("verbose_reasoner", True)
+        self._dtg = ret_time(time.time())
         _query_list = self.query_dict.get("query_list")
         query_list = self.generate_rag_query(_query_list)
         if self.query_state_manager.is_status_cancelled() is True:
@@ -63,24 +225,25 @@ class RAGQuery:
                 self.logger.warning("execute_new_rag_pipeline: Received cancel signal")
                 return
             response_len = 0
-            _msg = ""
-            for token in self.llm_api.query(None, query_list, self.query_state_manager):
+            msg_buf = TokenBuffer(self.query_state_manager.append_msg_texts)
+            is_cancelled = self.query_state_manager.is_status_cancelled
+            for token_idx, token in enumerate(
+                self.llm_api.query(None, query_list, self.query_state_manager)
+            ):
+                if token_idx & _CANCEL_CHECK_MASK == 0 and is_cancelled() is True:
+                    break
                 if token:
-                    if self.query_state_manager.is_status_cancelled() is True:
-                        self.query_state_manager.append_reasoner_header(
-                            "Query Cancelled"
-                        )
-                        self.query_state_manager.append_msg_text(" ")
-                        self.query_state_manager.set_status_idle()
-                        self.logger.warning(
-                            "execute_new_rag_pipeline: Received cancel signal"
-                        )
-                        return
                     if self.query_state_manager.get_status() == "Analyzing Context":
                         self.query_state_manager.set_status("Generating")
-                    self.query_state_manager.append_msg_text(token)
-                    _msg = f"{_msg}{token}"
-                    response_len = len(_msg)
+                    msg_buf.append(token)
+                    response_len += len(token)
+            msg_buf.flush()
+            if is_cancelled() is True:
+                self.query_state_manager.append_reasoner_header("Query Cancelled")
+                self.query_state_manager.append_msg_text(" ")
+                self.query_state_manager.set_status_idle()
+                self.logger.warning("execute_new_rag_pipeline: Received cancel signal")
+                return
             if response_len > 16:
                 break
             self.query_state_manager.append_reasoner_header("Query Restart")
@@ -93,7 +256,7 @@ class RAGQuery:
         """
         Generates a RAG query from a given list of queries.
 
-        This function processes each query in the provided list, expanding and formatting it as needed. It checks for cancellation status at various stages to allow early exit if required. The function generates conditions and context events based on the expanded query string and appends them back into the query list. If no events are found or if the process is cancelled, appropriate messages are logged, and an empty list is returned.
+        This function processes each query in the provided list, expanding and formatting it as needed. It checks for cancellation status at various stages to allow early exit if required. The function generates conditions and context events based on the expanded query string and appends them back into the query list. If no events are found or if the process is cancelled, appropriate messages are logged, and an empty list is returned. The time range extraction runs in a background thread while the query is expanded, its reasoner output is replayed after the expansion.
 
         Args:
             query_list (list): A list of queries to be processed. Each query should be a tuple where the second element is the query string.
@@ -103,12 +266,24 @@ class RAGQuery:
         """
         self.query_state_manager.set_status("Interpreting")
         query_string = query_list.pop()[1]
-        expanded_query_string = self.expand_ctx_query_string(query_string, query_list)
-        if self.query_state_manager.is_status_cancelled() is True:
-            return []
-        meta_dict = self.generate_time_range_conditions(query_string)
+        # Time range extraction only needs the raw query string, it runs with its own LLM API
+        # instance while the query is expanded and its reasoner output is replayed afterwards
+        reasoner_log = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            meta_future = executor.submit(
+                self.generate_time_range_conditions,
+                query_string,
+                LLMAPI(self.llm_config, self.logger),
+                reasoner_log,
+            )
+            expanded_query_string = self.expand_ctx_query_string(
+                query_string, query_list
+            )
+            meta_dict = meta_future.result()
         if self.query_state_manager.is_status_cancelled() is True:
             return []
+        for append, value in reasoner_log:
+            append(value)
         condition_dict = self.generate_query_conditions(expanded_query_string)
         if self.query_state_manager.is_status_cancelled() is True:
             return []
@@ -124,7 +299,7 @@ class RAGQuery:
         if self.verbose_reasoner is True:
             self.query_state_manager.append_reasoner_header("Generated Search Query")
             self.query_state_manager.append_reasoner_text(
-                json.dumps(query_dict, indent=2)
+                orjson.dumps(query_dict, option=orjson.OPT_INDENT_2).decode("utf-8")
             )
             self.query_state_manager.append_reasoner_header(
                 "Searching Forensic Artifacts"
@@ -153,7 +328,7 @@ class RAGQuery:
         )
         exe_rag_query = read_prompt("exe_rag_query")
         exe_rag_query = exe_rag_query.format(
-            dtg=ret_time(time.time()),
+            dtg=self._dtg,
             query_string=indent_string(query_string, spaces=8),
             expanded_query_string=indent_string(expanded_query_string, spaces=8),
         )
@@ -168,9 +343,13 @@ class RAGQuery:
         This method sets up the query state manager to 'Loading Context', retrieves values and
         metadata from the fragment (frag) using the given query dictionary, and constructs a
         verbose query string by appending truncated system monitor events until the token count
-        exceeds the maximum allowed context. It logs the number of retrieved events and their
-        context size, appends a reasoner header to the query state manager, and returns the
-        constructed verbose query if it is not empty; otherwise, it returns None.
+        exceeds the maximum allowed context. Events are tokenized once, in blocks of 32 with
+        get_token_cnts, the context size is tracked as a running token count, and the verbose
+        query is written to a StringIO buffer that is only materialized once. Accepted events
+        are handed to the query state manager in batches of 32. It logs the number of retrieved
+        events and their context size, appends a reasoner header to the query state manager,
+        and returns the constructed verbose query if it is not empty; otherwise, it returns
+        None.
 
         Args:
             query_dict (dict): A dictionary containing the query parameters.
@@ -181,21 +360,37 @@ class RAGQuery:
         self.query_state_manager.set_status("Loading Context")
         values, meta = self.frag.query(query_dict)
         ctx_cnt = 0
-        verbose_query = ""
-        for value in values:
-            trunc_value = trunc_sysmon_event(value)
-            if (
-                self.llm_api.get_token_cnt(verbose_query + str(trunc_value))
-                >= self.llm_api.max_rag_context
-            ):
+        ctx_tokens = 0
+        verbose_buf = io.StringIO()
+        events = []
+        context_full = False
+        # Events are tokenized in blocks, so few events past the context limit are counted
+        for block_start in range(0, len(values), 32):
+            block = values[block_start : block_start + 32]
+            trunc_values = [str(trunc_sysmon_event(value)) for value in block]
+            token_cnts = self.llm_api.get_token_cnts(trunc_values)
+            for value, trunc_value, value_tokens in zip(block, trunc_values, token_cnts):
+                if ctx_tokens + value_tokens >= self.llm_api.max_rag_context:
+                    context_full = True
+                    break
+                verbose_buf.write("\n")
+                verbose_buf.write(trunc_value)
+                verbose_buf.write("\n")
+                ctx_tokens += value_tokens
+                events.append(value)
+                if len(events) >= 32:
+                    self.query_state_manager.append_events(events)
+                    events = []
+                ctx_cnt += 1
+            if context_full:
                 break
-            verbose_query = f"{verbose_query}\n{trunc_value}\n"
-            self.query_state_manager.append_event(value)
-            ctx_cnt += 1
+        if events:
+            self.query_state_manager.append_events(events)
         self.logger.info(
-            f"generate_rag_query: Retrieved {ctx_cnt:,} events with {self.llm_api.get_token_cnt(verbose_query):,} context"
+            f"generate_rag_query: Retrieved {ctx_cnt:,} events with {ctx_tokens:,} context"
         )
         self.query_state_manager.append_reasoner_header(f"Retrieved {ctx_cnt:,} events")
+        verbose_query = verbose_buf.getvalue()
         if len(verbose_query) == 0:
             return None
         else:
@@ -210,7 +405,10 @@ class RAGQuery:
         a reasoner to potentially expand the original query string. If the verbose_reasoner flag
         is set, additional headers and text are appended to the query state manager for tracking.
         The function returns the expanded query if it is longer than the original query; otherwise,
-        it returns the original query.
+        it returns the original query. Results are cached per model, day of the query, query and
+        chat history, so repeated questions skip the reasoner round trip without reusing an
+        expansion that resolved relative dates against another day. Nothing is cached if the
+        reasoner returned no text or the query was cancelled.
 
         Args:
             query_string (str): The original user query string to be expanded.
@@ -221,15 +419,25 @@ class RAGQuery:
             str: The expanded query string if it is longer than the original query; otherwise,
                  the original query string.
         """
-        chat_list = []
-        for [speaker, text] in query_list:
-            chat_list.append(f"## {speaker.capitalize()}:")
-            chat_list.append(f"{text}")
-            chat_list.append("")
-        chat_history = "\n".join(chat_list)
+        chat_history = "\n".join(
+            f"## {speaker.capitalize()}:\n{text}\n" for speaker, text in query_list
+        )
+        cache_key = query_cache_key(
+            self.llm_api.model,
+            "expand_ctx_query",
+            self._dtg[:10],
+            query_string,
+            chat_history,
+        )
+        expanded_query_string = query_cache_get(cache_key)
+        if expanded_query_string is not None:
+            self.query_state_manager.append_reasoner_header("Expand User Query (cached)")
+            if self.verbose_reasoner is True:
+                self.query_state_manager.append_reasoner_text(f"{expanded_query_string}\n")
+            return expanded_query_string
         expand_ctx_query = read_prompt("expand_ctx_query")
         expand_ctx_query = expand_ctx_query.format(
-            dtg=ret_time(time.time()),
+            dtg=self._dtg,
             chat_history=indent_string(chat_history, spaces=12),
             user_query=indent_string(query_string, spaces=12),
         )
@@ -238,21 +446,28 @@ class RAGQuery:
             self.query_state_manager.append_reasoner_text(expand_ctx_query)
         else:
             self.query_state_manager.append_reasoner_header("Expand User Query")
-        expanded_query_string = self.stream_reasoner_query(expand_ctx_query)
-        if len(expanded_query_string) > len(query_string):
-            return expanded_query_string
-        else:
-            return query_string
+        reasoner_output = self.stream_reasoner_query(expand_ctx_query)
+        expanded_query_string = reasoner_output
+        if len(expanded_query_string) <= len(query_string):
+            expanded_query_string = query_string
+        if reasoner_output and self.query_state_manager.is_status_cancelled() is False:
+            query_cache_put(cache_key, expanded_query_string)
+        return expanded_query_string
 
     def generate_query_conditions(self, expanded_query_string):
         """
         Generates query conditions based on an expanded query string.
 
         This method sets up a state for analyzing the search and processes the query to generate
-        indicators of compromise (IOC). It iteratively reads prompts and formats them, handling
-        exceptions and adjusting the temperature of the language model API if necessary. The method
-        builds a dictionary of unique IOC strings and generates a condition dictionary based on these
-        strings up to a specified limit.
+        indicators of compromise (IOC). The IOC strings of each tactic matched by the prompt
+        search are only added once, using the shared IOC instance. It iteratively reads prompts
+        and formats them, handling exceptions and adjusting the temperature of the language
+        model API if necessary. The method builds a dictionary of unique IOC strings and
+        generates a condition dictionary based on these strings up to a specified limit. The
+        prompt is formatted once with the date time group of the query and reused on each
+        attempt. Condition dictionaries are cached per model, day of the query and expanded
+        query string, but only if at least one reply was parsed and the query was not cancelled,
+        and a copy of the cached dictionary is returned on a hit.
 
         Args:
             expanded_query_string (str): The query string that has been expanded for analysis.
@@ -261,7 +476,14 @@ class RAGQuery:
             dict: A dictionary containing the generated query conditions.
         """
         self.query_state_manager.set_status("Analyzing Search")
-        ioc = IOC()
+        cache_key = query_cache_key(
+            self.llm_api.model, "generate_indicators", self._dtg[:10], expanded_query_string
+        )
+        condition_dict = query_cache_get(cache_key)
+        if condition_dict is not None:
+            self.query_state_manager.append_reasoner_header("Building IOC Queries (cached)")
+            return obj_cp(condition_dict)
+        ioc = load_ioc()
         max_indc_limit = 100
         string_dict = {}
         q_dict = {
@@ -272,14 +494,18 @@ class RAGQuery:
             "condition_dict": {},
         }
         _, meta = self.frag.query(q_dict, prompts=True)
+        seen_tactics = set()
         for m in meta:
-            ioc_list = ioc.get_tactic_ioc(m["tactic"])
-            for entry in ioc_list:
-                string_dict[str(entry).casefold()] = True
-        generate_indicators = read_prompt("generate_indicators")
-        generate_indicators = generate_indicators.format(
-            dtg=ret_time(time.time()),
-            query_string=indent_string(expanded_query_string, spaces=8),
+            tactic = m["tactic"]
+            if tactic in seen_tactics:
+                continue
+            seen_tactics.add(tactic)
+            string_dict.update(dict.fromkeys(ioc.get_folded_tactic_ioc(tactic), True))
+        generate_indicators_prompt = read_prompt("generate_indicators")
+        query_block = indent_string(expanded_query_string, spaces=8)
+        generate_indicators = generate_indicators_prompt.format(
+            dtg=self._dtg,
+            query_string=query_block,
         )
         if self.verbose_reasoner is True:
             self.query_state_manager.append_reasoner_header("Building IOC Queries")
@@ -288,20 +514,16 @@ class RAGQuery:
             self.query_state_manager.append_reasoner_header("Building IOC Queries")
         cnt = 0
         max_cnt = 16
+        parsed = False
         while True:
             cnt += 1
             if cnt > max_cnt:
                 break
             if self.query_state_manager.is_status_cancelled() is True:
                 return {}
-            generate_indicators = read_prompt("generate_indicators")
-            generate_indicators = generate_indicators.format(
-                dtg=ret_time(time.time()),
-                query_string=indent_string(expanded_query_string, spaces=8),
-            )
             indicators = self.stream_reasoner_query(generate_indicators)
             try:
-                lines = json.loads(indicators.strip())
+                lines = orjson.loads(indicators)
                 if isinstance(lines, list):
                     if isinstance(lines[0], str):
                         pass
@@ -313,12 +535,13 @@ class RAGQuery:
                 self.llm_api.increase_temperature()
                 self.logger.debug(f"generate_query_conditions: raised {e}")
                 continue
+            parsed = True
             lines_added = 0
             for line in lines:
-                _line = str(line).casefold()
+                _line = _fold(str(line))
                 if len(_line) < 4:
                     continue
-                if (_line in string_dict) is False:
+                if _line not in string_dict:
                     lines_added += 1
                     string_dict[_line] = True
             if lines_added == 0:
@@ -327,22 +550,33 @@ class RAGQuery:
                 break
         self.llm_api.reset_temperature()
         condition_dict = self.generate_cond_dict(
-            list(string_dict.keys())[:max_indc_limit]
+            list(islice(string_dict, max_indc_limit))
         )
+        if parsed is True and self.query_state_manager.is_status_cancelled() is False:
+            query_cache_put(cache_key, obj_cp(condition_dict))
         return condition_dict
 
-    def generate_time_range_conditions(self, query_string):
+    def generate_time_range_conditions(self, query_string, llm_api, reasoner_log):
         """
         Generates time range conditions based on a query string.
 
-        This method appends a reasoner header and sets the status to 'Analyzing Time Ranges'. It then
-        iteratively extracts time ranges from the query string until valid start and end times are found,
-        or until a maximum count is reached or the operation is cancelled. If successful, it returns a
-        dictionary with the extracted time range conditions; otherwise, it raises an exception or
-        returns an empty dictionary if the operation is cancelled.
+        This method appends a reasoner header and then iteratively extracts time ranges from the
+        query string until valid start and end times are found, or until a maximum count is
+        reached or the operation is cancelled. If successful, it returns a dictionary with the
+        extracted time range conditions; otherwise, it raises an exception or returns an empty
+        dictionary if the operation is cancelled. The prompt is formatted once with the date
+        time group of the query and reused on each attempt. Query strings without any date, time
+        or time range words skip the LLM entirely and return None, and an empty JSON object from
+        the LLM ends the retries. The method runs in a background thread while the query is
+        expanded, so it queries and adjusts the temperature of the given LLM API instance,
+        leaves the status untouched and records its reasoner output in reasoner_log for the
+        caller to replay.
 
         Args:
             query_string (str): The query string from which to extract time ranges.
+            llm_api (LLMAPI): The LLM API instance used for the time range extraction.
+            reasoner_log (list): A list the reasoner output is appended to as tuples of a query
+                state manager method and its argument.
 
         Returns:
             dict: A dictionary containing the extracted time range conditions, or an empty dictionary
@@ -351,26 +585,37 @@ class RAGQuery:
         Raises:
             ValueError: If the extracted time range dictionary is not a valid dictionary.
         """
-        self.query_state_manager.append_reasoner_header("Extract Time Range")
-        self.query_state_manager.set_status("Analyzing Time Ranges")
+        append_header = self.query_state_manager.append_reasoner_header
+        if _TIME_HINT_RE.search(query_string) is None:
+            reasoner_log.append(
+                (append_header, "Extract Time Range (no time range in query)")
+            )
+            return None
+        reasoner_log.append((append_header, "Extract Time Range"))
         cnt = 0
         max_cnt = 16
         meta_dict = None
+        extract_timerange_prompt = read_prompt("extract_timerange")
+        query_block = indent_string(query_string, spaces=8)
+        extract_timerange = extract_timerange_prompt.format(
+            dtg=self._dtg,
+            query_string=query_block,
+        )
         while True:
             cnt += 1
             if cnt > max_cnt:
                 break
             if self.query_state_manager.is_status_cancelled() is True:
                 return {}
-            extract_timerange = read_prompt("extract_timerange")
-            extract_timerange = extract_timerange.format(
-                dtg=ret_time(time.time()),
-                query_string=indent_string(query_string, spaces=8),
+            _tr = self.stream_reasoner_query(
+                extract_timerange,
+                dot_chars=4,
+                llm_api=llm_api,
+                reasoner_log=reasoner_log,
             )
-            _tr = self.stream_reasoner_query(extract_timerange, dot_chars=4)
             try:
                 tr = self.carve_dict(_tr)
-                tr_dict = json.loads(tr.strip())
+                tr_dict = orjson.loads(tr)
                 if isinstance(tr_dict, dict):
                     if len(tr_dict.keys()) == 0:
                         break
@@ -385,18 +630,19 @@ class RAGQuery:
                 else:
                     raise ValueError("tr_dict is not dict")
             except Exception as e:
-                self.llm_api.increase_temperature()
+                llm_api.increase_temperature()
                 self.logger.debug(f"generate_time_range_conditions: raised {e}")
                 continue
-        self.llm_api.reset_temperature()
+        llm_api.reset_temperature()
         return meta_dict
 
     def carve_dict(self, text):
         """
         Removes lines containing backticks from a given text and returns the modified text.
 
-        This function splits the input text into lines, skips any line that contains a backtick
-        (`), and then joins the remaining lines back together to form the output text.
+        This function removes every line that contains a backtick (`) together with its
+        newline in a single scan of a precompiled regex, which gives the same output as
+        splitting the text into lines and joining the remaining lines back together.
 
         Args:
             text (str): The original text from which lines containing backticks should be removed.
@@ -404,31 +650,47 @@ class RAGQuery:
         Returns:
             str: The modified text with lines containing backticks removed.
         """
-        lines = []
-        for line in text.split("\n"):
-            if "`" in line:
-                continue
-            lines.append(line)
-        return "\n".join(lines)
+        carved = _BACKTICK_LINE_RE.sub("", text)
+        # A dropped last line leaves the newline of the line before it behind
+        if carved and "`" in text[text.rfind("\n") + 1 :]:
+            carved = carved[:-1]
+        return carved
 
-    def stream_reasoner_query(self, prompt, dot_chars=10):
+    def stream_reasoner_query(self, prompt, dot_chars=10, llm_api=None, reasoner_log=None):
         """
         Streams a reasoner query with specified parameters and handles the response.
 
         This function attempts to stream a query to an LLM API up to a maximum number of tries.
-        It appends generated tokens to the response string, managing the state through a
-        query state manager. If verbose mode is enabled, it directly appends tokens; otherwise,
-        it adds dots at specified intervals. The function handles cancellation requests and
-        restarts queries if necessary.
+        It collects generated tokens in a list that is joined once per attempt and keeps a
+        running character count of the response, managing the state through a
+        query state manager. If verbose mode is enabled, it appends tokens; otherwise, it adds
+        dots at specified intervals. Reasoner updates go through a TokenBuffer, so the query
+        state manager receives them in small batches, and cancellation is polled every 32 tokens
+        and once more after the stream ends. The function handles cancellation requests and
+        restarts queries if necessary. If a reasoner log is given, the reasoner output is
+        appended to it instead of the query state manager and the status is left untouched.
 
         Args:
             prompt (str): The input prompt for the LLM API query.
             dot_chars (int): The interval at which to append a dot character when not in verbose
                 mode, default is 10.
+            llm_api (LLMAPI, optional): The LLM API instance to query, defaults to the LLM API
+                of the instance.
+            reasoner_log (list, optional): A list the reasoner output is appended to as tuples
+                of a query state manager method and its argument, defaults to None.
 
         Returns:
             str: The generated response from the LLM API query.
         """
+        if llm_api is None:
+            llm_api = self.llm_api
+        append_header = self.query_state_manager.append_reasoner_header
+        append_text = self.query_state_manager.append_reasoner_text
+        append_texts = self.query_state_manager.append_reasoner_texts
+        if reasoner_log is not None:
+            append_header = partial(_log_append, reasoner_log, append_header)
+            append_text = partial(_log_append, reasoner_log, append_text)
+            append_texts = partial(_log_append, reasoner_log, append_texts)
         cnt = 0
         max_tries = 10
         ret_val = ""
@@ -437,28 +699,37 @@ class RAGQuery:
             if cnt > max_tries:
                 break
             if self.verbose_reasoner is False:
-                self.query_state_manager.append_reasoner_text("- .")
-            ret_val = ""
+                append_text("- .")
+            parts = []
             response_len = 0
-            for token in self.llm_api.query(
-                None, [["user", prompt]], self.query_state_manager
+            reasoner_buf = TokenBuffer(append_texts)
+            is_cancelled = self.query_state_manager.is_status_cancelled
+            for token_idx, token in enumerate(
+                llm_api.query(None, [["user", prompt]], self.query_state_manager)
             ):
-                if self.query_state_manager.is_status_cancelled() is True:
-                    return ""
+                if token_idx & _CANCEL_CHECK_MASK == 0 and is_cancelled() is True:
+                    break
                 if token:
-                    if self.query_state_manager.get_status() != "Generating":
+                    if (
+                        reasoner_log is None
+                        and self.query_state_manager.get_status() != "Generating"
+                    ):
                         self.query_state_manager.set_status("Generating")
-                    ret_val = f"{ret_val}{token}"
-                    response_len = len(ret_val)
+                    parts.append(token)
+                    response_len += len(token)
                     if self.verbose_reasoner is True:
-                        self.query_state_manager.append_reasoner_text(token)
+                        reasoner_buf.append(token)
                     elif response_len and response_len % dot_chars == 0:
-                        self.query_state_manager.append_reasoner_text(".")
+                        reasoner_buf.append(".")
+            reasoner_buf.flush()
+            if is_cancelled() is True:
+                return ""
+            ret_val = "".join(parts)
             if response_len >= 1:
                 break
-            self.query_state_manager.append_reasoner_header("Query Restart")
+            append_header("Query Restart")
             continue
-        self.query_state_manager.append_reasoner_text("\n")
+        append_text("\n")
         return ret_val
 
     @classmethod
@@ -467,9 +738,10 @@ class RAGQuery:
         Generates a condition dictionary from given text or list of words.
 
         This method processes input text or list to create a condition dictionary with
-        specified constraints on word length and maximum conditions. It sorts the words by
-        length in descending order, removes duplicates, and constructs a dictionary based on
-        the '$contains' key for single conditions or '$or' for multiple conditions.
+        specified constraints on word length and maximum conditions. It removes duplicates and
+        short words in a single pass, sorts the remaining words by length in descending order,
+        and constructs a dictionary based on the '$contains' key for single conditions or
+        '$or' for multiple conditions.
 
         Args:
             text (str or list): The input text or list of words to process. If it is a string,
@@ -490,19 +762,16 @@ class RAGQuery:
             words = text
         else:
             return {}
-        words.sort(key=len, reverse=True)
-        condition_list = []
-        condition_dict = {}
+        # Dedupe and length filter in one pass, only the survivors get sorted
         u_strings = {}
         for _word in words:
-            word = _word.strip(" \t.'\"\\`")
-            if word and len(word) >= min_len and (word in u_strings) is False:
-                condition_list.append({"$contains": word})
-                u_strings[word] = True
-            if len(condition_list) >= max_condition:
-                break
-        if len(condition_list) == 1:
-            condition_dict = {"$contains": condition_list[0]["$contains"]}
-        elif len(condition_list) > 1:
-            condition_dict = {"$or": condition_list}
+            word = _word.strip(_STRIP_CHARS)
+            if len(word) >= min_len:
+                u_strings[word] = None
+        survivors = sorted(u_strings, key=len, reverse=True)[:max_condition]
+        condition_dict = {}
+        if len(survivors) == 1:
+            condition_dict = {_CONTAINS: survivors[0]}
+        elif len(survivors) > 1:
+            condition_dict = {_OR: [{_CONTAINS: word} for word in survivors]}
         return condition_dict
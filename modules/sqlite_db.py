@@ -1,19 +1,33 @@
+import sys
 import sqlite3
+import threading
+
+# Per-thread pool of configured connections, keyed by database path
+_TLS = threading.local()
+# Bumped to invalidate the pooled connections of every thread
+_pool_generation = 0
+_pool_lock = threading.Lock()
+# Pooled connections of all threads, so that invalidate_db_pool can close them
+_pool_conns = set()
 
 
 class SQLiteDB:
 
     def __init__(self):
+        # page_size only takes effect before the first table of a new database is created
+        # and before it is switched to WAL mode, so it has to be the first pragma
+        mmap_size = 256 * 1024 * 1024 if sys.maxsize > 2**32 else 64 * 1024 * 1024
         self.pragmas = [
+            f"PRAGMA page_size = {8192}",
             f"PRAGMA busy_timeout = {30000}",
             "PRAGMA journal_mode = WAL",
             f"PRAGMA wal_autocheckpoint = {10000}",
             "PRAGMA case_sensitive_like = FALSE",
             "PRAGMA automatic_index = FALSE",
-            "PRAGMA temp_store = 1",
+            "PRAGMA temp_store = MEMORY",
             "PRAGMA synchronous = NORMAL",
             "PRAGMA foreign_keys = OFF",
-            f"PRAGMA mmap_size = {64 * 1024 * 1024}",
+            f"PRAGMA mmap_size = {mmap_size}",
             f"PRAGMA cache_size = {-32768}",
         ]
         self.mem_pragmas = [
@@ -23,6 +37,26 @@ class SQLiteDB:
             "PRAGMA case_sensitive_like = FALSE",
             "PRAGMA locking_mode = EXCLUSIVE",
         ]
+        self.pragma_script = self.build_pragma_script(self.pragmas)
+        self.mem_pragma_script = self.build_pragma_script(self.mem_pragmas)
+        self.backup_pragma_script = self.build_pragma_script(
+            self.pragmas + ["PRAGMA locking_mode = EXCLUSIVE"]
+        )
+
+    def build_pragma_script(self, pragmas):
+        """
+        Joins a list of PRAGMA statements into a single SQL script.
+
+        The script is run with executescript, so that all pragmas of a connection are parsed
+        and executed in one call instead of one execute round trip per pragma.
+
+        Args:
+            pragmas (list of str): A list of PRAGMA statements.
+
+        Returns:
+            str: The PRAGMA statements separated and terminated by semicolons.
+        """
+        return "".join(f"{pragma};\n" for pragma in pragmas)
 
     def backup(self, db, backup_path, pragmas=None):
         """
@@ -48,17 +82,14 @@ class SQLiteDB:
         bkup_db = sqlite3.connect(backup_path)
         bkup_cur = bkup_db.cursor()
         if pragmas is None:
-            for pragma in self.pragmas:
-                bkup_cur.execute(pragma)
-            bkup_cur.execute("PRAGMA locking_mode = EXCLUSIVE")
+            bkup_cur.executescript(self.backup_pragma_script)
         else:
-            for pragma in pragmas:
-                bkup_cur.execute(pragma)
+            bkup_cur.executescript(self.build_pragma_script(pragmas))
         db.backup(bkup_db)
         bkup_cur.close()
         bkup_db.close()
 
-    def connect(self, filepath, pragmas=None):
+    def connect(self, filepath, pragmas=None, check_same_thread=True):
         """
         Connects to a SQLite database and applies specified pragmas.
 
@@ -71,20 +102,20 @@ class SQLiteDB:
             filepath (str): The path to the SQLite database file.
             pragmas (list of str, optional): A list of PRAGMA statements to execute on the
                 database connection. If not provided, default pragmas are used.
+            check_same_thread (bool, optional): Whether only the creating thread may use the
+                connection. Defaults to True.
 
         Returns:
             tuple: A tuple containing the database connection and cursor objects.
         """
-        db = sqlite3.connect(filepath)
+        db = sqlite3.connect(filepath, check_same_thread=check_same_thread)
         cur = db.cursor()
         if filepath == ":memory:":
-            pragmas = self.mem_pragmas
-        if pragmas is None:
-            for pragma in self.pragmas:
-                cur.execute(pragma)
+            cur.executescript(self.mem_pragma_script)
+        elif pragmas is None:
+            cur.executescript(self.pragma_script)
         else:
-            for pragma in pragmas:
-                cur.execute(pragma)
+            cur.executescript(self.build_pragma_script(pragmas))
         return db, cur
 
 
@@ -92,8 +123,12 @@ def open_db(db_path):
     """
     Opens a database connection to an SQLite database at the specified path.
 
-    This function creates an instance of SQLiteDB and connects to the database at the given
-    path. It returns the database object and cursor for further operations.
+    Connections are pooled per thread and keyed by the database path, so repeated calls from
+    the same thread reuse an already configured connection instead of connecting and running
+    the pragmas again. Every call hands out a fresh cursor on the pooled connection, callers
+    must not change connection level state such as the row factory or pragmas. Pooled
+    connections are reused until invalidate_db_pool is called. A pooled connection that was
+    left inside a transaction by a failed caller is discarded and replaced.
 
     Args:
         db_path (str): The file path to the SQLite database.
@@ -101,14 +136,80 @@ def open_db(db_path):
     Returns:
         tuple: A tuple containing the database connection object and the cursor.
     """
-    dbf = SQLiteDB()
-    db, cur = dbf.connect(db_path)
-    return db, cur
+    pool = getattr(_TLS, "pool", None)
+    if pool is None:
+        pool = _TLS.pool = {}
+    entry = pool.get(db_path)
+    if entry is not None and (
+        entry[1] != _pool_generation or entry[0].in_transaction
+    ):
+        _discard_db(entry[0])
+        entry = None
+    if entry is None:
+        dbf = SQLiteDB()
+        # Pooled connections may be closed by invalidate_db_pool from another thread
+        db, cur = dbf.connect(db_path, check_same_thread=False)
+        cur.close()
+        with _pool_lock:
+            entry = (db, _pool_generation)
+            _pool_conns.add(db)
+        pool[db_path] = entry
+    return entry[0], entry[0].cursor()
+
+
+def _is_pooled(db):
+    """
+    Checks whether a connection is pooled by the calling thread.
+
+    Args:
+        db (sqlite3.Connection): The database connection to check.
+
+    Returns:
+        bool: True if the connection is in the pool of the calling thread, otherwise False.
+    """
+    pool = getattr(_TLS, "pool", None)
+    if pool:
+        for entry in pool.values():
+            if entry[0] is db:
+                return True
+    return False
+
+
+def _discard_db(db):
+    """
+    Rolls back and closes a connection and removes it from the pool of the calling thread.
+
+    Args:
+        db (sqlite3.Connection): The database connection to discard.
+
+    Returns:
+        None
+    """
+    pool = getattr(_TLS, "pool", None)
+    if pool:
+        for db_path, entry in list(pool.items()):
+            if entry[0] is db:
+                pool.pop(db_path)
+    with _pool_lock:
+        _pool_conns.discard(db)
+    try:
+        if db.in_transaction:
+            db.rollback()
+    except sqlite3.Error:
+        pass
+    try:
+        db.close()
+    except sqlite3.Error:
+        pass
 
 
 def close_db(db, cur):
     """
-    Closes a database connection and its cursor, committing any pending transactions beforehand.
+    Closes a database cursor, committing any pending transactions beforehand.
+
+    Connections handed out by open_db stay open in the pool of the calling thread, any other
+    connection is closed. If the connection is still inside a transaction afterwards, because
+    the commit failed, it is rolled back, closed and removed from the pool.
 
     Args:
         db (object): The database object to be closed.
@@ -119,17 +220,47 @@ def close_db(db, cur):
             transactions.
     """
     cur.close()
-    if db.in_transaction:
-        db.commit()
-    db.close()
+    try:
+        if db.in_transaction:
+            db.commit()
+    finally:
+        if db.in_transaction or _is_pooled(db) is False:
+            _discard_db(db)
+
+
+def invalidate_db_pool():
+    """
+    Invalidates the pooled connections of all threads.
+
+    The pooled connections of every thread are closed right away, so that no open handle is
+    left on the database files, and each thread replaces its connection on its next open_db
+    call. This must be called before a database file is deleted or replaced, while no other
+    thread is using a pooled connection.
+
+    Returns:
+        None
+    """
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        conns = list(_pool_conns)
+        _pool_conns.clear()
+    for db in conns:
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+    pool = getattr(_TLS, "pool", None)
+    if pool:
+        pool.clear()
 
 
 def dict_factory(cursor, row):
     """
     Converts a database row into a dictionary using cursor description.
 
-    This function iterates over the cursor's description and maps each column name to its
-    corresponding value in the row, returning a dictionary with these mappings.
+    This function zips the cursor's description with the row and maps each column name to its
+    corresponding value in a single dictionary comprehension.
 
     Args:
         cursor (object): The database cursor object containing the query result metadata.
@@ -139,7 +270,4 @@ def dict_factory(cursor, row):
         dict: A dictionary where keys are column names and values are the corresponding row
             values.
     """
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
+    return {col[0]: value for col, value in zip(cursor.description, row)}
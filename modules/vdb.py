@@ -9,8 +9,7 @@ warnings.filterwarnings(
 warnings.filterwarnings(
     "ignore", message=".*Torch was not compiled with flash attention.*"
 )
-from collections import defaultdict
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 import math
 import time
 import os
@@ -22,9 +21,8 @@ from transformers import logging as transformers_logging
 transformers_logging.set_verbosity_error()
 from chromadb.config import Settings as ChromaSettings
 import chromadb
-from chromadb.utils.batch_utils import create_batches
 from transformers import AutoTokenizer
-from modules.sqlite_db import open_db, close_db, dict_factory
+from modules.sqlite_db import open_db, close_db, invalidate_db_pool, dict_factory
 from utils.utils import ret_time, split_string_into_n_parts
 
 
@@ -50,8 +48,8 @@ class VectorDB:
         Connects to a vector database and initializes necessary components.
 
         This method sets up a connection to a vector database using ChromaDB's PersistentClient. It
-        initializes a SentenceTransformer model on either 'cuda' or 'cpu', depending on availability.
-        It also creates or retrieves collections for the main collection and prompts from the vector
+        initializes a SentenceTransformer model on either 'cuda' or 'cpu', depending on availability,
+        in half precision on 'cuda'. It also creates or retrieves collections for the main collection and prompts from the vector
         database. Additionally, it sets up tokenization with AutoTokenizer and initializes lists for IDs,
         documents, and metadata. If a SQLite database file does not exist, it bootstraps an artifact
         file table and marks the database as new; otherwise, it sets the database as existing. Finally,
@@ -72,18 +70,39 @@ class VectorDB:
 
         if device == "cpu":
             self.logger.warning(f"connect_vdb: Torch is running with {device}")
+            self.set_torch_threads()
         else:
             self.logger.info(f"connect_vdb: Torch is running with {device}")
         
-        self.model = SentenceTransformer(self.model_name, device=device)
+        model_kwargs = {}
+        if device == "cuda":
+            # Half precision doubles encode throughput with negligible embedding drift, loading
+            # the weights as float16 avoids materializing a float32 copy first
+            model_kwargs["torch_dtype"] = torch.float16
+        self.model = SentenceTransformer(
+            self.model_name, device=device, model_kwargs=model_kwargs
+        )
         self.collection = self.chroma_client.get_or_create_collection(
             name=self.collection_name
         )
         self.prompt_collection = self.chroma_client.get_or_create_collection(
             name="prompts"
         )
+        # Largest number of records Chroma accepts per upsert, asked once per connection
+        self._chroma_batch = self.chroma_client.max_batch_size
         self.min_entry_len = 8
         self.max_chunk_len = 512
+        # Pages per block of shards handed to the encoder thread by add_pages
+        self.page_block_size = 256
+        self._encode_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="vdb_encode"
+        )
+        # Token counts of short texts, see cache_token_cnts
+        self._token_cnt_cache = {}
+        self._token_cnt_cache_max = 100000
+        self._token_cnt_cache_text_len = 256
+        # SentenceTransformer.encode sorts its inputs by length, so batches pad little
+        self.encode_batch_size = 64
         self.tokenizer = AutoTokenizer.from_pretrained(
             f"sentence-transformers/{self.model_name}",
             clean_up_tokenization_spaces=True,
@@ -141,8 +160,10 @@ class VectorDB:
         Returns:
             None
         """
+        self._encode_executor.shutdown(wait=True)
         self.tokenizer = None
         del self.tokenizer
+        self._token_cnt_cache.clear()
         self.prompt_collection = None
         del self.prompt_collection
         self.collection = None
@@ -170,12 +191,38 @@ class VectorDB:
         except Exception as e:
             self.logger.critical(f"drop_db: Deleting vector db raised {e}")
         try:
+            invalidate_db_pool()
             if os.path.isfile(self.sqlite_db_path) is True:
                 os.remove(self.sqlite_db_path)
         except Exception as e:
             self.logger.critical(f"drop_db: Deleting Sqlite3 db raised {e}")
         return
 
+    def set_torch_threads(self):
+        """
+        Limits the torch CPU threads to the number of physical cores.
+
+        Torch defaults to one thread per logical core, which oversubscribes hyperthreaded
+        CPUs during CPU inference. The intra-op threads are set to half the logical cores and
+        the inter-op threads to one, unless OMP_NUM_THREADS is set in the environment. The
+        inter-op threads can only be set once per process, errors are logged and ignored.
+
+        Returns:
+            None
+        """
+        if os.environ.get("OMP_NUM_THREADS"):
+            return
+        num_threads = max(1, (os.cpu_count() or 2) // 2)
+        try:
+            torch.set_num_threads(num_threads)
+            torch.set_num_interop_threads(1)
+        except RuntimeError as e:
+            self.logger.warning(f"set_torch_threads: Setting torch threads raised {e}")
+        self.logger.info(
+            f"set_torch_threads: Torch is using {torch.get_num_threads()} threads and "
+            f"{torch.get_num_interop_threads()} inter-op threads"
+        )
+
     def is_new_db(self):
         """
         Checks if a new database is being used.
@@ -270,77 +317,80 @@ class VectorDB:
             pages_added (int): The number of pages added to the artifact files.
             shards_added (int): The number of shards added to the artifact files.
 
+        Raises:
+            Exception: If an error occurs during SQL operations or if the database is closed.
+        """
+        self.update_artifact_files_bulk([(file_info, pages_added, shards_added)])
+
+    def update_artifact_files_bulk(self, updates):
+        """
+        Updates the records of several artifact files in a single transaction.
+
+        This function checks if the database is open and upserts an artifact file record for
+        every entry in updates with a single INSERT ... ON CONFLICT DO UPDATE statement, which
+        adds the page and shard counts to existing records. All records are written by one
+        executemany call inside one BEGIN IMMEDIATE transaction, so a batch of files costs a
+        single commit instead of one per file. If an SQL operation fails, the error is logged
+        and the whole batch is rolled back.
+
+        Args:
+            self (object): The instance of the class containing this method.
+            updates (list of tuple): A list of (file_info, pages_added, shards_added) tuples,
+                with the same meaning as the arguments of update_artifact_files.
+
         Raises:
             Exception: If an error occurs during SQL operations or if the database is closed.
         """
         if self.open is False:
             self.logger.critical(f"update_artifact_files: Database is CLOSED")
             return
-        sha256 = file_info.get("SHA256", "")
-        sha1 = file_info.get("SHA1", "")
-        md5 = file_info.get("MD5", "")
-        filepath = file_info.get("filepath", "")
-        file_sz = file_info.get("file_size", "")
-        file_type = file_info.get("file_type")
         now = time.time()
         now_str = ret_time(now)
         db, cur = open_db(self.sqlite_db_path)
         try:
-            check_sql = """
-                SELECT *
-                    FROM artifact_files
-                WHERE
-                    sha256 = ? AND filepath = ?
-            """
-            cur.execute(check_sql, [sha256, filepath])
-            row = cur.fetchone()
-            if row:
-                update_sql = """
-                    UPDATE artifact_files
-                        SET update_string = ?,
-                            update_utc = ?,
-                            item_count = item_count + ?,
-                            shard_count = shard_count + ?
-                        WHERE sha256 = ? AND filepath = ?
-                """
-                cur.execute(
-                    update_sql,
-                    [now_str, now, pages_added, shards_added, sha256, filepath],
+            upsert_sql = """
+                INSERT INTO artifact_files
+                (
+                    sha256, sha1, md5, filepath, file_sz,
+                    file_type, enter_string, update_string, enter_utc, update_utc,
+                    item_count, shard_count
                 )
-            else:
-                insert_sql = """
-                    INSERT INTO artifact_files
-                    (
-                        sha256, sha1, md5, filepath, file_sz,
-                        file_type, enter_string, update_string, enter_utc, update_utc,
-                        item_count, shard_count
-                    )
-                    VALUES
-                    (
-                        ?, ?, ?, ?, ?,
-                        ?, ?, ?, ?, ?,
-                        ?, ?
-                    )
-                """
-                cur.execute(
-                    insert_sql,
-                    [
-                        sha256,
-                        sha1,
-                        md5,
-                        filepath,
-                        file_sz,
-                        file_type,
-                        now_str,
-                        now_str,
-                        now,
-                        now,
-                        pages_added,
-                        shards_added,
-                    ],
+                VALUES
+                (
+                    ?, ?, ?, ?, ?,
+                    ?, ?, ?, ?, ?,
+                    ?, ?
                 )
+                ON CONFLICT(sha256, filepath) DO UPDATE
+                    SET update_string = excluded.update_string,
+                        update_utc = excluded.update_utc,
+                        item_count = item_count + excluded.item_count,
+                        shard_count = shard_count + excluded.shard_count
+            """
+            rows = [
+                [
+                    file_info.get("SHA256", ""),
+                    file_info.get("SHA1", ""),
+                    file_info.get("MD5", ""),
+                    file_info.get("filepath", ""),
+                    file_info.get("file_size", ""),
+                    file_info.get("file_type"),
+                    now_str,
+                    now_str,
+                    now,
+                    now,
+                    pages_added,
+                    shards_added,
+                ]
+                for file_info, pages_added, shards_added in updates
+            ]
+            cur.execute("BEGIN IMMEDIATE")
+            cur.executemany(upsert_sql, rows)
+            db.commit()
         except Exception as e:
             self.logger.error(f"update_artifact_files: Raised {e}")
+            if db.in_transaction:
+                db.rollback()
         close_db(db, cur)
 
     def count_tokens(self, text):
@@ -360,8 +410,70 @@ class VectorDB:
         if self.open is False:
             self.logger.critical(f"update_artifact_files: Database is CLOSED")
             return 0
-        tokens = self.tokenizer.encode(text, truncation=False, add_special_tokens=True)
-        return len(tokens)
+        token_cnt = self._token_cnt_cache.get(text)
+        if token_cnt is None:
+            tokens = self.tokenizer.encode(text, truncation=False, add_special_tokens=True)
+            token_cnt = len(tokens)
+            self.cache_token_cnts([text], [token_cnt])
+        return token_cnt
+
+    def cache_token_cnts(self, texts, token_cnts):
+        """
+        Stores the token counts of short texts in the token count cache.
+
+        Only texts of up to _token_cnt_cache_text_len characters are cached. Words and short
+        lines recur across the pages of an artifact, while caching whole pages would only
+        hold on to large strings that are rarely seen again. The cache is cleared once it
+        holds more than _token_cnt_cache_max entries, and when the database is closed.
+
+        Args:
+            texts (list of str): The tokenized texts.
+            token_cnts (list of int): The token counts of the texts, in the order of texts.
+        """
+        if len(self._token_cnt_cache) >= self._token_cnt_cache_max:
+            self._token_cnt_cache.clear()
+        max_len = self._token_cnt_cache_text_len
+        for text, token_cnt in zip(texts, token_cnts):
+            if len(text) <= max_len:
+                self._token_cnt_cache[text] = token_cnt
+
+    def count_tokens_batch(self, texts):
+        """
+        Counts the tokens of a list of texts with a single tokenizer call.
+
+        The texts are encoded as one batch by the fast tokenizer, which is much cheaper than
+        calling count_tokens once per text. Cached counts are reused and every distinct
+        uncached text is only tokenized once. Token counts include special tokens, the same
+        as count_tokens.
+
+        Args:
+            texts (list of str): The input texts to be tokenized.
+
+        Returns:
+            list of int: The number of tokens of each text, in the order of texts.
+        """
+        if self.open is False:
+            self.logger.critical(f"update_artifact_files: Database is CLOSED")
+            return [0] * len(texts)
+        cache = self._token_cnt_cache
+        token_cnts = [cache.get(text) for text in texts]
+        misses = list(dict.fromkeys(t for t, c in zip(texts, token_cnts) if c is None))
+        if not misses:
+            return token_cnts
+        enc = self.tokenizer(
+            misses,
+            truncation=False,
+            add_special_tokens=True,
+            return_length=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        miss_cnts = dict(zip(misses, enc["length"]))
+        self.cache_token_cnts(misses, enc["length"])
+        return [
+            miss_cnts[text] if token_cnt is None else token_cnt
+            for text, token_cnt in zip(texts, token_cnts)
+        ]
 
     def peek(self):
         """
@@ -401,7 +513,10 @@ class VectorDB:
 
         This method processes each page in the provided list of pages, chunks them if they
         exceed the maximum token length, and adds them to the specified collection along
-        with their embeddings and metadata. It updates artifact files after processing.
+        with their embeddings and metadata. Shards are prepared in blocks of pages, and each
+        block is encoded and upserted on a background thread while the next block is chunked,
+        so tokenization overlaps with model inference. It updates artifact files after
+        processing.
 
         Args:
             self (object): The instance of the class containing this method.
@@ -418,108 +533,168 @@ class VectorDB:
         if self.open is False:
             self.logger.critical(f"update_artifact_files: Database is CLOSED")
             return 0
+        if prompts is True:
+            collection = self.prompt_collection
+        else:
+            collection = self.collection
+        shards_added = 0
+        pages_added = 0
+        pending = None
+        try:
+            for ids, documents, metadatas, block_pages in self.prepare_shards(
+                pages, file_info
+            ):
+                pages_added += block_pages
+                shards_added += len(ids)
+                if not ids:
+                    continue
+                # Only one block is encoded at a time while the next one is prepared
+                if pending is not None:
+                    pending.result()
+                pending = self._encode_executor.submit(
+                    self.encode_and_upsert, collection, ids, documents, metadatas
+                )
+        finally:
+            if pending is not None:
+                pending.result()
+        self.update_artifact_files(file_info, pages_added, shards_added)
+        return shards_added
+
+    def prepare_shards(self, pages, file_info):
+        """
+        Chunks pages into shards and builds their IDs and metadata in blocks of pages.
+
+        Pages that are not longer than min_entry_len are skipped. Each block of
+        page_block_size pages is encoded with one batched tokenizer call, and the encoding of
+        a page provides both its token count and the token offsets used to chunk pages
+        exceeding the maximum token length.
+
+        Args:
+            pages (list): A list of tuples where each tuple contains a UTC timestamp and a page
+                of text to be added.
+            file_info (dict): A dictionary containing information about the file, including
+                SHA256 hash, file path, file type, and optional metadata list.
+
+        Yields:
+            tuple: The shard IDs, documents and metadatas of a block of pages, and the number
+                of pages in the block that were added.
+        """
         sha256 = file_info.get("SHA256", "")
         filepath = file_info.get("filepath", "")
         file_type = file_info.get("file_type", "")
         meta_list = file_info.get("meta_list", None)
-        ids = []
-        documents = []
-        metadatas = []
-        shards_added = 0
-        pages_added = 0
-        for idx, (utc, page) in enumerate(pages):
-            if len(page) <= self.min_entry_len:
-                continue
-            pages_added += 1
-            source_doc_id = self.generate_doc_id()
-            if self.count_tokens(page) > self.max_chunk_len:
-                item_chunks = self.chunk_text(page, self.max_chunk_len)
-                seq_id = 1
+        file_meta = {"SHA256": sha256, "filepath": filepath, "file_type": file_type}
+        pages = [
+            (idx, utc, page)
+            for idx, (utc, page) in enumerate(pages)
+            if len(page) > self.min_entry_len
+        ]
+        for block_start in range(0, len(pages), self.page_block_size):
+            block = pages[block_start : block_start + self.page_block_size]
+            enc = None
+            if self.tokenizer.is_fast is True:
+                # One encoding per page serves both the token count and the chunking
+                enc = self.tokenizer(
+                    [page for _, _, page in block],
+                    truncation=False,
+                    add_special_tokens=False,
+                    return_offsets_mapping=True,
+                    return_attention_mask=False,
+                    return_token_type_ids=False,
+                )
+                specials = self.tokenizer.num_special_tokens_to_add()
+                token_cnts = [len(ids) + specials for ids in enc["input_ids"]]
+            else:
+                token_cnts = self.count_tokens_batch([page for _, _, page in block])
+            ids = []
+            documents = []
+            metadatas = []
+            for block_idx, ((idx, utc, page), token_cnt) in enumerate(
+                zip(block, token_cnts)
+            ):
+                source_doc_id = self.generate_doc_id()
+                if token_cnt <= self.max_chunk_len:
+                    item_chunks = [page]
+                elif enc is not None:
+                    item_chunks = self.chunk_offsets(
+                        page,
+                        enc["offset_mapping"][block_idx],
+                        enc.word_ids(block_idx),
+                        self.max_chunk_len,
+                    )
+                else:
+                    item_chunks = self.chunk_text(page, self.max_chunk_len)
                 seq_cnt = len(item_chunks)
-                for chunk in item_chunks:
+                extra_meta = None
+                if meta_list:
+                    extra_meta = {
+                        key: str(value) for key, value in meta_list[idx].items()
+                    }
+                for seq_id, chunk in enumerate(item_chunks, start=1):
                     ids.append(f"{source_doc_id}.{seq_id}")
                     documents.append(chunk)
+                    # Only the first shard of a page carries the file metadata
                     if seq_id == 1:
-                        metadatas.append(
-                            {
-                                "source_doc_id": source_doc_id,
-                                "seq_id": seq_id,
-                                "seq_cnt": seq_cnt,
-                                "SHA256": sha256,
-                                "filepath": filepath,
-                                "file_type": file_type,
-                                "utc": utc,
-                            }
-                        )
+                        metadata = {
+                            "source_doc_id": source_doc_id,
+                            "seq_id": seq_id,
+                            "seq_cnt": seq_cnt,
+                            **file_meta,
+                            "utc": utc,
+                        }
                     else:
-                        metadatas.append(
-                            {
-                                "source_doc_id": source_doc_id,
-                                "seq_id": seq_id,
-                                "seq_cnt": seq_cnt,
-                                "utc": utc,
-                            }
-                        )
-                    if meta_list:
-                        for key, value in meta_list[idx].items():
-                            metadatas[-1][key] = str(value)
-                    seq_id += 1
-                    shards_added += 1
-            else:
-                ids.append(f"{source_doc_id}.1")
-                documents.append(page)
-                metadatas.append(
-                    {
-                        "source_doc_id": source_doc_id,
-                        "seq_id": 1,
-                        "seq_cnt": 1,
-                        "SHA256": sha256,
-                        "filepath": filepath,
-                        "file_type": file_type,
-                        "utc": utc,
-                    }
-                )
-                shards_added += 1
-                if meta_list:
-                    for key, value in meta_list[idx].items():
-                        metadatas[-1][key] = str(value)
-        if ids and documents and metadatas:
-            embeddings = (
-                self.model.encode(documents, convert_to_tensor=True).cpu().tolist()
-            )
-            batches = create_batches(
-                api=self.chroma_client,
-                ids=ids,
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas,
+                        metadata = {
+                            "source_doc_id": source_doc_id,
+                            "seq_id": seq_id,
+                            "seq_cnt": seq_cnt,
+                            "utc": utc,
+                        }
+                    if extra_meta:
+                        metadata.update(extra_meta)
+                    metadatas.append(metadata)
+            yield ids, documents, metadatas, len(block)
+
+    def encode_and_upsert(self, collection, ids, documents, metadatas):
+        """
+        Encodes shard documents and upserts them with their embeddings into a collection.
+
+        The embeddings are kept in a numpy array that is only converted to lists one upsert
+        batch at a time, as Chroma only accepts lists.
+
+        Args:
+            collection (chromadb.Collection): The collection to upsert the shards into.
+            ids (list of str): The shard IDs.
+            documents (list of str): The shard documents.
+            metadatas (list of dict): The shard metadatas.
+        """
+        embeddings = self.model.encode(
+            documents,
+            batch_size=self.encode_batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        batch_size = self._chroma_batch
+        for i in range(0, len(ids), batch_size):
+            collection.upsert(
+                ids=ids[i : i + batch_size],
+                documents=documents[i : i + batch_size],
+                embeddings=embeddings[i : i + batch_size].tolist(),
+                metadatas=metadatas[i : i + batch_size],
             )
-            if prompts is True:
-                collection = self.prompt_collection
-            else:
-                collection = self.collection
-            for batch in batches:
-                collection.upsert(
-                    ids=batch[0],
-                    documents=batch[3],
-                    embeddings=batch[1],
-                    metadatas=batch[2],
-                )
-        self.update_artifact_files(file_info, pages_added, shards_added)
-        return shards_added
 
     def generate_doc_id(self):
         """
         Generates a unique document ID.
 
-        This function generates and returns a unique document ID by creating a UUID and shifting it
-        right by 64 bits to ensure uniqueness within the system. The resulting value is converted
-        to a string for easy storage and retrieval.
+        This function generates and returns a unique document ID from 64 random bits read with
+        os.urandom, which unlike uuid1 needs no lock or clock and MAC lookup. The resulting value
+        is converted to a decimal string, the same format as the previous uuid1 based IDs, for
+        easy storage and retrieval.
 
         Returns:
             str: A unique document ID as a string.
         """
-        return str(uuid.uuid1().int >> 64)
+        return str(int.from_bytes(os.urandom(8), "big"))
 
     def query(self, query_dict, prompts=False):
         """
@@ -529,8 +704,9 @@ class VectorDB:
         query parameters from the input dictionary and constructs an argument dictionary for the
         collection's query method. The function handles optional conditions and metadata filters,
         and processes the results to ensure they are within specified limits. If prompts are enabled,
-        it queries a different collection. The results are sorted by their UTC timestamp before being
-        returned.
+        it queries a different collection. Only documents and metadatas are requested, and twice
+        n_results hits are only fetched when hits are de-duplicated by source document. The source
+        documents of all kept hits are fetched with a single get call. The results are sorted by their UTC timestamp before being returned.
 
         Args:
             query_dict (dict): A dictionary containing query parameters such as 'query_string',
@@ -544,43 +720,32 @@ class VectorDB:
         if self.open is False:
             self.logger.critical(f"update_artifact_files: Database is CLOSED")
             return [], []
-        query_string = query_dict.get("query_string", "")
-        doc_multi_hit = query_dict.get("doc_multi_hit", False)
-        max_shard_ctx = int(query_dict.get("max_shard_ctx", 3))
-        n_results = int(query_dict.get("n_results", 500))
-        condition_dict = query_dict.get("condition_dict", None)
-        meta_dict = query_dict.get("meta_dict", None)
-
-        ret_val = []
-        ret_meta = []
-
-        if isinstance(query_string, str):
-            query_string = [query_string]
-        
-        if isinstance(n_results, int) is False:
-            n_results = int(n_results)
-        
-        _n_results = n_results * 2
-        if _n_results > self.count():
-            _n_results = self.count()
-            # Sanity
-            if _n_results <= 0:
-                _n_results = n_results
-        
-        args = {"query_texts": query_string, "n_results": _n_results}
-        if condition_dict and isinstance(condition_dict, dict):
-            args["where_document"] = condition_dict
-        if meta_dict and isinstance(meta_dict, dict):
-            args["where"] = meta_dict
         if prompts is True:
             collection = self.prompt_collection
         else:
             collection = self.collection
-
+        args, doc_multi_hit, max_shard_ctx, n_results = self._normalize_query_args(
+            query_dict, collection.count()
+        )
+        ret_val = []
+        ret_meta = []
         results = collection.query(**args)
         metadatas = results.get("metadatas", [[]])[0]
         documents = results.get("documents", [[]])[0]
         if len(metadatas) == len(documents):
+            # Fetch the source documents of the hits the loop below will keep in one call
+            doc_ids = {}
+            hit_cnt = 0
+            for meta in metadatas:
+                if hit_cnt >= n_results:
+                    break
+                source_doc_id = meta.get("source_doc_id", "")
+                if source_doc_id:
+                    if source_doc_id in doc_ids and doc_multi_hit is False:
+                        continue
+                    doc_ids[source_doc_id] = True
+                hit_cnt += 1
+            source_docs = self.get_source_docs(list(doc_ids), prompts)
             source_doc_id_added = {}
             for idx, meta in enumerate(metadatas):
                 if len(ret_val) >= n_results:
@@ -591,9 +756,16 @@ class VectorDB:
                     if source_doc_id in source_doc_id_added:
                         continue
                     seq_id = meta.get("seq_id", "")
-                    _doc = self.get_source_doc_context(
-                        source_doc_id, seq_id, max_shard_ctx, prompts
-                    )
+                    if source_doc_id in source_docs:
+                        _doc = None
+                        if source_docs[source_doc_id] is not None:
+                            _doc = self.reconstruct_documents(
+                                source_docs[source_doc_id], seq_id, max_shard_ctx
+                            )
+                    else:
+                        _doc = self.get_source_doc_context(
+                            source_doc_id, seq_id, max_shard_ctx, prompts
+                        )
                     if _doc:
                         doc = _doc
                         if doc_multi_hit is False:
@@ -617,6 +789,49 @@ class VectorDB:
             sorted_value.append(d[1])
         return sorted_value, sorted_meta
 
+    @staticmethod
+    def _normalize_query_args(query_dict, doc_cnt):
+        """
+        Builds the arguments of a collection query from a query dictionary.
+
+        Args:
+            query_dict (dict): A dictionary containing query parameters such as 'query_string',
+                'doc_multi_hit', 'max_shard_ctx', 'n_results', 'condition_dict', and 'meta_dict'.
+            doc_cnt (int): The number of documents in the queried collection.
+
+        Returns:
+            tuple: The keyword arguments for the collection query, followed by the normalized
+                doc_multi_hit, max_shard_ctx and n_results values.
+        """
+        query_string = query_dict.get("query_string", "")
+        doc_multi_hit = query_dict.get("doc_multi_hit", False)
+        max_shard_ctx = int(query_dict.get("max_shard_ctx", 3))
+        n_results = int(query_dict.get("n_results", 500))
+        condition_dict = query_dict.get("condition_dict", None)
+        meta_dict = query_dict.get("meta_dict", None)
+        if isinstance(query_string, str):
+            query_string = [query_string]
+        # Hits of an already added source document are skipped, over-fetch to make up for them
+        if doc_multi_hit is False:
+            _n_results = n_results * 2
+        else:
+            _n_results = n_results
+        if _n_results > doc_cnt:
+            _n_results = doc_cnt
+            # Sanity
+            if _n_results <= 0:
+                _n_results = n_results
+        args = {
+            "query_texts": query_string,
+            "n_results": _n_results,
+            "include": ["metadatas", "documents"],
+        }
+        if condition_dict and isinstance(condition_dict, dict):
+            args["where_document"] = condition_dict
+        if meta_dict and isinstance(meta_dict, dict):
+            args["where"] = meta_dict
+        return args, doc_multi_hit, max_shard_ctx, n_results
+
     def get_source_doc_context(self, doc_id, seq_id, max_shard_ctx, prompts):
         """
         Retrieves the source document context for a given document ID and sequence ID.
@@ -645,13 +860,54 @@ class VectorDB:
         else:
             return None
 
+    def get_source_docs(self, doc_ids, prompts):
+        """
+        Retrieves the shards of several source documents with a single query.
+
+        This function selects the appropriate collection based on whether prompts are enabled
+        or not and fetches the shards of all given source documents with one '$in' filter,
+        instead of one get call per document. The shards are grouped by their source document
+        ID in the format expected by reconstruct_documents.
+
+        Args:
+            doc_ids (list of str): The unique identifiers of the source documents to retrieve.
+            prompts (bool): A flag indicating whether to use the prompt collection or not.
+
+        Returns:
+            dict: A dictionary mapping each requested document ID to a dictionary with
+                'metadatas' and 'documents' lists, or to None if the document was not found.
+        """
+        source_docs = dict.fromkeys(doc_ids)
+        if not doc_ids:
+            return source_docs
+        if prompts is True:
+            collection = self.prompt_collection
+        else:
+            collection = self.collection
+        results = collection.get(
+            where={"source_doc_id": {"$in": doc_ids}},
+            include=["metadatas", "documents"],
+        )
+        if not results:
+            return source_docs
+        for metadata, document in zip(
+            results.get("metadatas") or [], results.get("documents") or []
+        ):
+            source_doc_id = metadata["source_doc_id"]
+            if source_docs.get(source_doc_id) is None:
+                source_docs[source_doc_id] = {"metadatas": [], "documents": []}
+            source_docs[source_doc_id]["metadatas"].append(metadata)
+            source_docs[source_doc_id]["documents"].append(document)
+        return source_docs
+
     def reconstruct_documents(self, data, search_seq_id, max_shard_ctx):
         """
         Reconstructs documents from given data based on sequence ID and context range.
 
         This function processes metadata and document chunks to reconstruct original documents.
-        It filters the chunks within a specified sequence ID range and concatenates them in order
-        to form complete documents. The reconstructed documents are then returned as a single
+        It places the chunks within a specified sequence ID range into a fixed number of slots per
+        document, indexed by their sequence ID, and concatenates them in order to form complete
+        documents without sorting. The reconstructed documents are then returned as a single
         string.
 
         Args:
@@ -664,41 +920,72 @@ class VectorDB:
         Returns:
             str: A single string containing all reconstructed documents concatenated together.
         """
-        docs = defaultdict(lambda: [])
+        lo_seq_id = int(search_seq_id) - max_shard_ctx
+        slot_cnt = 2 * max_shard_ctx + 1
+        docs = {}
         metadatas, documents = data["metadatas"], data["documents"]
-        file_meta = {}
         for metadata, document in zip(metadatas, documents):
-            source_doc_id = metadata["source_doc_id"]
-            seq_id = metadata["seq_id"]
-            if seq_id in (1, "1"):
-                file_meta = metadata
-                if "seq_id" in file_meta:
-                    del file_meta["seq_id"]
-                if "seq_cnt" in file_meta:
-                    del file_meta["seq_cnt"]
-            if (
-                seq_id >= search_seq_id - max_shard_ctx
-                and seq_id <= search_seq_id + max_shard_ctx
-            ):
-                docs[source_doc_id].append((seq_id, document))
-        reconstructed_docs = []
-        for source_doc_id, chunks in docs.items():
-            sorted_chunks = sorted(chunks, key=lambda x: x[0])
-            full_document = "".join(chunk[1] for chunk in sorted_chunks)
-            reconstructed_docs.append(full_document)
-        return "".join(reconstructed_docs)
+            slot = int(metadata["seq_id"]) - lo_seq_id
+            if slot < 0 or slot >= slot_cnt:
+                continue
+            slots = docs.get(metadata["source_doc_id"])
+            if slots is None:
+                slots = docs[metadata["source_doc_id"]] = [None] * slot_cnt
+            slots[slot] = document
+        return "".join(
+            "".join(chunk for chunk in slots if chunk is not None)
+            for slots in docs.values()
+        )
 
     def chunk_text(self, text, max_length=512):
         """
         Chunks a given text into smaller parts based on a specified maximum length.
 
-        This method iterates over possible chunk sizes and splits the input text accordingly.
-        It checks if the token count of the first chunk is within the specified max_length,
-        returning the chunks if true. If no suitable chunk size is found, it falls back to an
-        internal method for further processing.
+        This method encodes the text once with the fast tokenizer and walks its tokens in
+        windows of max_length tokens, leaving room for the special tokens. Window boundaries
+        are moved back to the start of a word where possible, and the chunks are sliced from
+        the original text using the token offsets, so the chunks concatenate back to the
+        original text. If a chunk still exceeds max_length tokens or the tokenizer provides
+        no offsets, it falls back to an internal method for further processing.
+
+        Args:
+            text (str): The input text to be chunked.
+            max_length (int, optional): The maximum length of each chunk in tokens. Defaults
+                to 512.
+
+        Returns:
+            list: A list of text chunks where the token count of each chunk is less than or
+                  equal to max_length.
+        """
+        window = max_length - self.tokenizer.num_special_tokens_to_add()
+        if window < 1 or self.tokenizer.is_fast is False:
+            return self._chunk_text(text, max_length)
+        enc = self.tokenizer(
+            text,
+            truncation=False,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return self.chunk_offsets(
+            text, enc["offset_mapping"], enc.word_ids(), max_length
+        )
+
+    def chunk_offsets(self, text, offsets, word_ids, max_length=512):
+        """
+        Chunks a text using the token offsets and word IDs of an existing encoding.
+
+        This method holds the windowing logic of chunk_text for callers that have already
+        encoded the text without special tokens, so the text is not tokenized a second time.
+        Window boundaries are moved back to the start of a word where possible, and the chunks
+        are sliced from the original text. If a chunk still exceeds max_length tokens, it falls
+        back to _chunk_text.
 
         Args:
             text (str): The input text to be chunked.
+            offsets (list of tuple): The (start, end) character offsets of each token.
+            word_ids (list of int): The word index of each token.
             max_length (int, optional): The maximum length of each chunk in tokens. Defaults
                 to 512.
 
@@ -706,11 +993,26 @@ class VectorDB:
             list: A list of text chunks where the token count of each chunk is less than or
                   equal to max_length.
         """
-        for i in range(2, 1024):
-            chunks = split_string_into_n_parts(text, i)
-            if self.count_tokens(chunks[0]) <= max_length:
-                return chunks
-        return self._chunk_text(text, max_length)
+        window = max_length - self.tokenizer.num_special_tokens_to_add()
+        if window < 1:
+            return self._chunk_text(text, max_length)
+        bounds = [0]
+        start = 0
+        while len(offsets) - start > window:
+            cut = start + window
+            while cut > start and word_ids[cut] == word_ids[cut - 1]:
+                cut -= 1
+            if cut == start:
+                # A single word spans the whole window
+                cut = start + window
+            if offsets[cut][0] > bounds[-1]:
+                bounds.append(offsets[cut][0])
+            start = cut
+        bounds.append(len(text))
+        chunks = [text[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+        if max(self.count_tokens_batch(chunks)) > max_length:
+            return self._chunk_text(text, max_length)
+        return chunks
 
     def _chunk_text(self, text, max_length=512):
         """
@@ -719,7 +1021,10 @@ class VectorDB:
         This method takes a piece of text and splits it into smaller chunks such that each
         chunk does not exceed the given maximum length, measured in tokens. It ensures that
         words are not split across chunks unless they themselves exceed the maximum length,
-        in which case they are divided into multiple parts.
+        in which case they are divided into multiple parts. All words are tokenized in one
+        batch and the token count of the current chunk is kept as a running sum, instead of
+        re-tokenizing the growing chunk for every word. The current chunk is tracked as a
+        range of word indices and joined once when it is emitted.
 
         Args:
             text (str): The input text to be chunked.
@@ -729,29 +1034,25 @@ class VectorDB:
             list of str: A list of text chunks where each chunk's token count does not exceed
                 the specified maximum length.
         """
-        words = str(text).split(" ")
+        words = [word for word in str(text).split(" ") if word]
+        word_lens = self.count_tokens_batch(words)
+        specials = self.tokenizer.num_special_tokens_to_add()
         chunks = []
-        current_chunk = []
-        for word in words:
-            if not word:
-                continue
-            word_len = self.count_tokens(word)
-            if (
-                current_chunk
-                and self.count_tokens(" ".join(current_chunk)) + word_len > max_length
-            ):
+        # Index of the first word of the current chunk
+        start = 0
+        # Token count of the current chunk without special tokens
+        chunk_len = 0
+        for i, word_len in enumerate(word_lens):
+            if i > start and chunk_len + specials + word_len > max_length:
+                chunks.append(" ".join(words[start:i]))
+                chunk_len = 0
                 if word_len > max_length:
-                    if current_chunk:
-                        chunks.append(" ".join(current_chunk))
-                        current_chunk = []
                     ratio = math.ceil(word_len / max_length) + 1
-                    _split = split_string_into_n_parts(word, ratio)
-                    for s in _split:
-                        chunks.append(s)
+                    chunks.extend(split_string_into_n_parts(words[i], ratio))
+                    start = i + 1
                     continue
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-            current_chunk.append(word)
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+                start = i
+            chunk_len += word_len - specials
+        if start < len(words):
+            chunks.append(" ".join(words[start:]))
         return chunks
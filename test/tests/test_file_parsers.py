@@ -1,11 +1,15 @@
 import unittest
 import logging
+import os
+import shutil
+import tempfile
 
 from artifacts.parsers.pdf_file import identify_pdf, parse_pdf
 from artifacts.parsers.pe_file import identify_pe, parse_pe
 from artifacts.parsers.mft_file import identify_mft, parse_mft
 from artifacts.parsers.registry_file import identify_reg, parse_reg
 from artifacts.parsers.evtx_file import identify_evtx, parse_evtx
+from artifacts.file_parser import ArtifactParser
 
 from artifacts.event_filter import filter_mft_path, filter_evtx_event, is_windows_autorun, is_lol_bin, references_lol_bin
 
@@ -28,6 +32,33 @@ class TestParsers(unittest.TestCase):
             1,
         )
 
+    def test_iter_pages(self):
+        ap = ArtifactParser(logger)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for fname, file_type, n_pages in [
+                ("sysmon.evtx", "Windows EVTX File", 1),
+                ("Amcache", "Windows Registry File", 315),
+            ]:
+                fpath = os.path.join(tmp_dir, fname)
+                shutil.copy(f"test/files/{fname}", fpath)
+                batches = list(ap.iter_pages(fpath, 100))
+                self.assertEqual(
+                    n_pages,
+                    sum(len(chunk) for _, chunk in batches),
+                )
+                self.assertEqual(
+                    True,
+                    all(len(chunk) <= 100 for _, chunk in batches),
+                )
+                self.assertEqual(
+                    file_type,
+                    batches[0][0]["file_type"],
+                )
+                self.assertEqual(
+                    False,
+                    os.path.exists(fpath),
+                )
+
     def test_mft(self):
         self.assertEqual(
             True,
@@ -108,4 +139,21 @@ class TestParsers(unittest.TestCase):
         self.assertEqual(
             True,
             references_lol_bin("\"powershell.exe\""),
-        )
\ No newline at end of file
+        )
+
+    def test_references_lol_bin(self):
+        for text in [
+            "C:\\Windows\\System32\\cmd.exe /c whoami",
+            "rundll32.exe,foo",
+            "x.exe y.exe certutil.exe -urlcache",
+            "POWERSHELL.EXE -enc",
+        ]:
+            self.assertEqual(
+                True,
+                references_lol_bin(text),
+            )
+        for text in ["notepad.exe", "no exe here", ""]:
+            self.assertEqual(
+                False,
+                references_lol_bin(text),
+            )
\ No newline at end of file
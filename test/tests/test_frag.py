@@ -1,8 +1,13 @@
 import unittest
 import logging
+import os
+import tempfile
+import threading
 
 
 from modules.frag import FRAG
+from modules.vdb import VectorDB
+from modules.sqlite_db import open_db, close_db, invalidate_db_pool
 
 
 logging.basicConfig(
@@ -51,4 +56,78 @@ class TestFrag(unittest.TestCase):
         self.assertEqual(
             1,
             len(meta),
-        )
\ No newline at end of file
+        )
+
+
+class TestArtifactFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.vdb = VectorDB.__new__(VectorDB)
+        self.vdb.logger = logger
+        self.vdb.sqlite_db_path = os.path.join(self.tmp_dir.name, "test.db")
+        self.vdb.open = True
+        self.vdb.bootstrap_artifact_file_table()
+
+    def tearDown(self):
+        invalidate_db_pool()
+        self.tmp_dir.cleanup()
+
+    def test_upsert(self):
+        file_info = {
+            "SHA256": "a" * 64,
+            "SHA1": "b" * 40,
+            "MD5": "c" * 32,
+            "filepath": "sysmon.evtx",
+            "file_size": 1024,
+            "file_type": "Windows EVTX File",
+        }
+        self.vdb.update_artifact_files(file_info, 10, 2)
+        self.vdb.update_artifact_files_bulk(
+            [(file_info, 5, 1), (dict(file_info, filepath="other.evtx"), 7, 3)]
+        )
+        rows = {
+            row["filepath"]: (row["item_count"], row["shard_count"])
+            for row in self.vdb.artifact_file_table
+        }
+        self.assertEqual(
+            {"sysmon.evtx": (15, 3), "other.evtx": (7, 3)},
+            rows,
+        )
+
+    def test_pool(self):
+        db, cur = open_db(self.vdb.sqlite_db_path)
+        close_db(db, cur)
+        db_2, cur = open_db(self.vdb.sqlite_db_path)
+        close_db(db_2, cur)
+        self.assertIs(db, db_2)
+
+        cur = db.cursor()
+        cur.execute("BEGIN")
+        cur.execute("DELETE FROM artifact_files")
+        cur.close()
+        db_3, cur = open_db(self.vdb.sqlite_db_path)
+        self.assertIsNot(db, db_3)
+        self.assertEqual(False, db_3.in_transaction)
+        close_db(db_3, cur)
+
+        opened = threading.Event()
+        release = threading.Event()
+        worker_dbs = []
+
+        def worker():
+            db, cur = open_db(self.vdb.sqlite_db_path)
+            close_db(db, cur)
+            worker_dbs.append(db)
+            opened.set()
+            release.wait()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        opened.wait()
+        invalidate_db_pool()
+        try:
+            with self.assertRaises(Exception):
+                worker_dbs[0].execute("SELECT 1")
+        finally:
+            release.set()
+            thread.join()
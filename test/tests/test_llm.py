@@ -48,6 +48,10 @@ class TestLLM(unittest.TestCase):
             llm_api.get_token_cnt("Test token text"),
             9,
         )
+        self.assertEqual(
+            llm_api.get_token_cnts(["Test token text", "Test token text"]),
+            [9, 9],
+        )
 
     def test_llm_query(self):
         config = read_llm_config(logger)
@@ -0,0 +1,81 @@
+import unittest
+import logging
+
+from modules.obj import QueryStateManager, ArtifactStateManager
+
+
+logging.basicConfig(
+    level=logging.WARN, format=f"%(asctime)s.%(msecs)03d %(levelname)s:%(message)s",
+    datefmt="%d-%b-%y %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+class TestQueryStateManager(unittest.TestCase):
+    def test_query_slice(self):
+        qsm = QueryStateManager()
+        qsm.append_msg_text("Hello ")
+        qsm.append_msg_texts(["wor", "ld"])
+        qsm.append_reasoner_text("step")
+        qsm.append_events([{"id": 1}, {"id": 2}])
+        query_slice = qsm.get_query_slice()
+        self.assertEqual(
+            "Hello world",
+            query_slice["msg"],
+        )
+        self.assertEqual(
+            True,
+            query_slice["reasoner"].endswith("step"),
+        )
+        self.assertEqual(
+            [{"id": 1}, {"id": 2}],
+            query_slice["events"],
+        )
+
+        query_slice = qsm.get_query_slice()
+        self.assertEqual(
+            ("", "", []),
+            (query_slice["msg"], query_slice["reasoner"], query_slice["events"]),
+        )
+
+    def test_snapshot_last_update(self):
+        qsm = QueryStateManager()
+        qsm.set_status_active()
+        last_update = qsm.get_snapshot()[3]
+        qsm.append_msg_text("token")
+        self.assertEqual(
+            qsm.last_update,
+            qsm.get_snapshot()[3],
+        )
+        self.assertGreaterEqual(
+            qsm.get_snapshot()[3],
+            last_update,
+        )
+        self.assertEqual(
+            "Active",
+            qsm.get_snapshot()[0],
+        )
+
+
+class TestArtifactStateManager(unittest.TestCase):
+    def test_status_order(self):
+        asm = ArtifactStateManager()
+        filepaths = [f"data/uploads/file_{i}.evtx" for i in range(64)]
+        for filepath in filepaths:
+            asm.add_file(filepath)
+        asm.mark_file_in_progress(filepaths[10])
+        asm.mark_file_done(filepaths[3])
+        asm.mark_file_deleted(filepaths[5])
+        status = asm.get_status()
+        self.assertEqual(
+            filepaths[:5] + filepaths[6:],
+            list(status),
+        )
+        self.assertEqual(
+            ("done", "in-progress", "queued"),
+            (
+                status[filepaths[3]]["status"],
+                status[filepaths[10]]["status"],
+                status[filepaths[0]]["status"],
+            ),
+        )
@@ -0,0 +1,132 @@
+import unittest
+import logging
+import time
+
+from utils.utils import (
+    chunk_list,
+    split_string_into_n_parts,
+    indent_string,
+    remove_markdown,
+    format_json_for_llm,
+    ts_to_utc,
+)
+
+
+logging.basicConfig(
+    level=logging.WARN, format=f"%(asctime)s.%(msecs)03d %(levelname)s:%(message)s",
+    datefmt="%d-%b-%y %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+class TestUtils(unittest.TestCase):
+    def test_remove_markdown(self):
+        self.assertEqual(
+            "Title\n\nSome **bold** text with a link and",
+            remove_markdown(
+                "# Title\n\nSome **bold** text with a [link](http://x.y) and ![img](a.png)\n"
+            ),
+        )
+        self.assertEqual(
+            "quote\nitem one\nitem two\nnested\nfirst\ntenth",
+            remove_markdown("> quote\n- item one\n* item two\n  + nested\n1. first\n10. tenth\n"),
+        )
+        self.assertEqual(
+            "code block\nstrike and inline",
+            remove_markdown("```\ncode block\n```\n~~strike~~ and `inline` ---\n"),
+        )
+        self.assertEqual(
+            "",
+            remove_markdown("\n\n   \n- \n"),
+        )
+        self.assertEqual(
+            "a(c)",
+            remove_markdown("![alt [nested]](u) [a](b)(c) ![](x)"),
+        )
+
+    def test_remove_markdown_pathological(self):
+        for text, expected in [
+            ("![" * 20000, "![" * 20000),
+            ("\n" * 20000 + "x", "x"),
+            (" \n" * 20000, ""),
+        ]:
+            t0 = time.perf_counter()
+            self.assertEqual(
+                expected,
+                remove_markdown(text),
+            )
+            self.assertLess(
+                time.perf_counter() - t0,
+                1.0,
+            )
+
+    def test_ts_to_utc(self):
+        self.assertEqual(
+            1678243210.998531,
+            ts_to_utc("2023-03-08T02:40:10.998531Z"),
+        )
+        for dtg in [
+            "2023-03-08 02:40:10 +0000",
+            "2023-03-08 02:40:10 UTC",
+            "2023-03-08T02:40:10+00:00",
+        ]:
+            self.assertEqual(
+                1678243210.0,
+                ts_to_utc(dtg),
+            )
+        self.assertEqual(
+            1678233600.0,
+            ts_to_utc("2023-03-08"),
+        )
+        self.assertEqual(
+            0.0,
+            ts_to_utc(""),
+        )
+        self.assertEqual(
+            0.0,
+            ts_to_utc("garbage"),
+        )
+
+    def test_format_json_for_llm(self):
+        self.assertEqual(
+            "a: 1\nb: \n  c: \n    1\n    d: x\n\n  e: \n\nf: \n\ng: None",
+            format_json_for_llm(
+                {"a": 1, "b": {"c": [1, {"d": "x"}, []], "e": {}}, "f": [], "g": None}
+            ),
+        )
+        self.assertEqual(
+            "1\n2\n3\nk: v",
+            format_json_for_llm([1, [2, 3], {"k": "v"}]),
+        )
+        self.assertEqual(
+            "",
+            format_json_for_llm({}),
+        )
+        self.assertEqual(
+            "",
+            format_json_for_llm([]),
+        )
+
+    def test_indent_string(self):
+        self.assertEqual(
+            "  a\n  b\n  \n  c",
+            indent_string("a\nb\n\nc", spaces=2),
+        )
+        self.assertEqual(
+            "  x\n  ",
+            indent_string("x\n", spaces=2),
+        )
+        self.assertEqual(
+            "    ",
+            indent_string(""),
+        )
+
+    def test_chunk_list(self):
+        self.assertEqual(
+            [[0, 1, 2], [3, 4, 5], [6]],
+            list(chunk_list(list(range(7)), 3)),
+        )
+        self.assertEqual(
+            ["abcd", "efg", "hij"],
+            split_string_into_n_parts("abcdefghij", 3),
+        )
@@ -1,7 +1,9 @@
 import unittest
 from test.tests.test_file_parsers import TestParsers
-from test.tests.test_frag import TestFrag
+from test.tests.test_frag import TestFrag, TestArtifactFiles
 from test.tests.test_llm import TestLLM
+from test.tests.test_obj import TestQueryStateManager, TestArtifactStateManager
+from test.tests.test_utils import TestUtils
 
 # Basic tests, not comprehensive
 if __name__ == "__main__":
@@ -1,10 +1,75 @@
 import datetime
 import os
-import json
+import stat
+import time
 import re
+import tempfile
+from itertools import islice
+import orjson
 import ciso8601
 
 EPOCH = datetime.datetime.utcfromtimestamp(0)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+# Markdown patterns used by remove_markdown, applied in this order. The image and list
+# patterns are written so that failed matches do not rescan the rest of a line or a run of
+# blank lines from every position, see remove_markdown
+_MD_IMG = re.compile(
+    "!\\[(?:[^\\]\\n]|\\](?!\\())*+\\]\\([^)\\n]*+\\)|(!\\[[^\\n]*)"
+)
+_MD_LINK = re.compile("\\[([^\\[]+)\\]\\((.*?)\\)")
+_MD_STRIKE = re.compile("~~(.*?)~~")
+_MD_CODE = re.compile("`{1,3}(.+?)`{1,3}")
+_MD_FENCE = re.compile("```[\\s\\S]*?```")
+_MD_HDR = re.compile("#{1,6}\\s*(.*)")
+_MD_HR = re.compile("([-*_]){3,}")
+_MD_BQ = re.compile("^>\\s?", re.MULTILINE)
+_MD_UL = re.compile("^(?:\\s*+[-+*]\\s+|(\\s+))", re.MULTILINE)
+_MD_OL = re.compile("^(?:\\s*+\\d+\\.\\s+|(\\s+))", re.MULTILINE)
+
+# Parsed config and prompt files, keyed by path and validated against the file stat
+_CFG_CACHE = {}
+_PROMPT_CACHE = {}
+
+# Lines of Sysmon events kept by trunc_sysmon_event, matched by key prefix
+_SYSMON_KEYS = (
+    "Channel",
+    "EventID",
+    "SystemTime",
+    "User",
+    "UtcTime",
+    "CommandLine",
+    "Image",
+    "IntegrityLevel",
+    "LogonId",
+    "OriginalFileName",
+    "ParentCommandLine",
+    "ParentImage",
+    "SourceIp",
+    "SourcePort",
+    "DestinationIp",
+    "DestinationPort",
+    "DestinationHostname",
+    "SourceImage",
+    "TargetImage",
+    "StartModule",
+    "StartFunction",
+    "GrantedAccess",
+    "CallTrace",
+    "TargetObject",
+    "EventType",
+    "Details",
+    "EventNamespace",
+    "Name",
+    "Query",
+    "Type",
+    "Destination",
+    "Consumer",
+    "Filter",
+)
+_SYSMON_RE = re.compile(
+    "(?m)^[ \\t]*(?:" + "|".join(map(re.escape, _SYSMON_KEYS)) + ")[^\\n]*"
+)
 
 
 def ret_time(t):
@@ -12,8 +77,8 @@ def ret_time(t):
     Converts a Unix timestamp to a formatted date and time string.
 
     This function takes an integer representing a Unix timestamp and converts it to a
-    UTC datetime object. It then formats the datetime object into a string with the format
-    '%m/%d/%Y %H:%M:%S'.
+    UTC struct_time with time.gmtime, which avoids building a datetime object. It then
+    formats the struct_time into a string with the format '%m/%d/%Y %H:%M:%S'.
 
     Args:
         t (int): The Unix timestamp to convert.
@@ -21,7 +86,7 @@ def ret_time(t):
     Returns:
         str: A formatted date and time string in the format 'MM/DD/YYYY HH:MM:SS'.
     """
-    return datetime.datetime.utcfromtimestamp(int(t)).strftime("%m/%d/%Y %H:%M:%S")
+    return time.strftime("%m/%d/%Y %H:%M:%S", time.gmtime(int(t)))
 
 
 def chunk_list(long_list, _max_chunk):
@@ -30,8 +95,8 @@ def chunk_list(long_list, _max_chunk):
 
         This function takes a long list and splits it into smaller lists (chunks) of a given
         maximum size. It raises an exception if the input is not a list. The function uses a
-        generator to yield each chunk, allowing for efficient iteration over large lists without
-        consuming excessive memory.
+        generator that takes each chunk from a single iterator over the list with islice,
+        allowing for efficient iteration over large lists without consuming excessive memory.
 
         Args:
             long_list (list): The list to be split into chunks.
@@ -42,13 +107,14 @@ def chunk_list(long_list, _max_chunk):
             list: A chunk of the original list with a length up to max_chunk.
 
         Raises:
-            ValueError: If long_list is not a list.
+            ValueError: If long_list is not a list or max_chunk is less than 1.
     """
     max_chunk = int(_max_chunk)
-    if not (long_list, list):
+    if not isinstance(long_list, list) or max_chunk < 1:
         raise ValueError
-    for i in range(0, len(long_list), max_chunk):
-        yield long_list[i : i + max_chunk]
+    it = iter(long_list)
+    while batch := list(islice(it, max_chunk)):
+        yield batch
 
 
 def split_string_into_n_parts(s, n):
@@ -67,16 +133,37 @@ def split_string_into_n_parts(s, n):
         Returns:
             list: A list containing n substrings, each being a part of the original string.
     """
-    length = len(s)
-    part_size = length // n
-    remainder = length % n
-    parts = []
-    start = 0
-    for i in range(n):
-        end = start + part_size + (1 if i < remainder else 0)
-        parts.append(s[start:end])
-        start = end
-    return parts
+    part_size, remainder = divmod(len(s), n)
+    # The first remainder parts are one character longer than the rest
+    return [
+        s[i * part_size + min(i, remainder) : (i + 1) * part_size + min(i + 1, remainder)]
+        for i in range(n)
+    ]
+
+
+def file_stat_key(path):
+    """
+    Returns a key identifying the current version of a regular file.
+
+    The key is built from the modification time in nanoseconds, the size and the inode of the
+    file, so a cached copy of the file contents can be validated with a single stat call. The
+    inode changes whenever a file is replaced, even within the timestamp resolution of the
+    file system.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        tuple or None: A tuple of the modification time, size and inode of the file, or None
+            if the path does not exist or is not a regular file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
 
 
 def read_llm_config(logger):
@@ -85,7 +172,9 @@ def read_llm_config(logger):
 
     This function attempts to read the configuration settings for an LLM (Large Language
     Model) from a specified JSON file. If the file exists, it reads and parses the
-    contents into a dictionary. In case of any exceptions during reading or parsing, it
+    contents into a dictionary. The parsed configuration is cached until the modification
+    time or size of the file changes, and a shallow copy is returned so callers cannot
+    change the cached dictionary. In case of any exceptions during reading or parsing, it
     logs the error using the provided logger and returns a default configuration.
 
     Args:
@@ -107,10 +196,16 @@ def read_llm_config(logger):
         "debug": False,
     }
     config_path = "config/config.json"
-    if os.path.isfile(config_path) is True:
+    key = file_stat_key(config_path)
+    if key is not None:
+        cached = _CFG_CACHE.get(config_path)
+        if cached is not None and cached[0] == key:
+            return cached[1].copy()
         try:
-            with open(config_path, "r") as f:
-                config = json.loads(f.read())
+            with open(config_path, "rb") as f:
+                parsed = orjson.loads(f.read())
+            config = parsed.copy()
+            _CFG_CACHE[config_path] = (key, parsed)
         except Exception as e:
             logger.error(f"read_llm_config: Raised {e}, loading default config")
     return config
@@ -120,7 +215,13 @@ def write_llm_config(config, logger):
     """
     Writes LLM configuration to a file.
 
-    This function writes the given configuration to a JSON file at the specified path. It
+    This function writes the given configuration to a JSON file at the specified path. The
+    write is skipped when the file is unchanged since it was last read and already holds
+    the given configuration. The configuration is serialized first and written to a
+    uniquely named temporary file next to the config file, which keeps the permissions of
+    the config file and then replaces it, so concurrent readers see either the old or the
+    new file, concurrent writers never share a temporary file and a failed write never
+    leaves a truncated config behind. It
     handles exceptions and logs any errors that occur during the writing process.
 
     Args:
@@ -132,8 +233,28 @@ def write_llm_config(config, logger):
     """
     config_path = "config/config.json"
     try:
-        with open(config_path, "w") as f:
-            f.write(json.dumps(config, indent=2))
+        cached = _CFG_CACHE.get(config_path)
+        if (
+            cached is not None
+            and cached[1] == config
+            and cached[0] == file_stat_key(config_path)
+        ):
+            return
+        data = orjson.dumps(config, option=orjson.OPT_INDENT_2)
+        _CFG_CACHE.pop(config_path, None)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(config_path), prefix="config.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if os.path.isfile(config_path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(config_path).st_mode))
+            os.replace(tmp_path, config_path)
+        except Exception:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            raise
     except Exception as e:
         logger.error(f"write_llm_config: Raised {e}")
     return
@@ -144,8 +265,10 @@ def read_prompt(query_name):
     Reads a prompt from a file based on the given query name.
 
     This function constructs a path to a prompt file using the provided query name and
-    checks if the file exists. If it does, the function opens the file, reads its content,
-    and returns it as a string. If the file does not exist, an empty string is returned.
+    checks if the file exists. If it does, the function reads the file as bytes and decodes
+    it as UTF-8 in one call, independent of the locale, and returns it as a string. If the
+    file does not exist, an empty string is returned. The content is cached until the
+    modification time or size of the file changes.
 
     Args:
         query_name (str): The name of the query used to construct the path to the prompt
@@ -155,10 +278,20 @@ def read_prompt(query_name):
         str: The content of the prompt file if it exists, otherwise an empty string.
     """
     card_path = f"prompts/{query_name}.prompt"
-    if os.path.isfile(card_path):
-        with open(card_path, "r") as f:
-            return f.read()
-    return ""
+    key = file_stat_key(card_path)
+    if key is None:
+        return ""
+    cached = _PROMPT_CACHE.get(card_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(card_path, "rb") as f:
+        data = f.read()
+    if b"\r" in data:
+        # Same newline translation as reading in text mode
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    prompt = data.decode("utf-8")
+    _PROMPT_CACHE[card_path] = (key, prompt)
+    return prompt
 
 
 def indent_string(text, spaces=4):
@@ -166,8 +299,9 @@ def indent_string(text, spaces=4):
     Indents a given string by adding spaces to each line.
 
     This function takes a multi-line string and indents each line by a specified number of
-    spaces. It splits the input text into lines, prepends the specified number of spaces to
-    each line, and then joins them back together with newline characters.
+    spaces. It prepends the indentation to the text and inserts it after every newline
+    character with a single replace, instead of splitting the text into lines and joining
+    them back together.
 
     Args:
         text (str): The original multi-line string to be indented.
@@ -177,11 +311,7 @@ def indent_string(text, spaces=4):
         str: The indented string with the specified number of spaces added to each line.
     """
     delim = " " * spaces
-    ret_list = []
-    string_list = text.split("\n")
-    for s in string_list:
-        ret_list.append(f"{delim}{s}")
-    return "\n".join(ret_list)
+    return delim + text.replace("\n", "\n" + delim)
 
 
 def remove_markdown(_text):
@@ -193,6 +323,12 @@ def remove_markdown(_text):
     blockquotes, unordered lists, ordered lists, and bold/italic emphasis. The cleaned text is
     then returned without any leading or trailing whitespace.
 
+    An image that cannot match at one position cannot match later on the same line either,
+    and a list item that cannot match at the start of a run of blank lines cannot match
+    inside it. The image and list patterns therefore consume such a line rest or run in a
+    group that is substituted back unchanged, so the backtracking engine stays linear in the
+    length of the text.
+
     Args:
         _text (str): The input text containing markdown formatting to be removed.
 
@@ -202,16 +338,16 @@ def remove_markdown(_text):
     text = f"{_text}"
     text = text.replace("```\n", "")
     text = text.replace("```", "")
-    text = re.sub("!\\[.*?\\]\\(.*?\\)", "", text)
-    text = re.sub("\\[([^\\[]+)\\]\\((.*?)\\)", "\\1", text)
-    text = re.sub("~~(.*?)~~", "\\1", text)
-    text = re.sub("`{1,3}(.+?)`{1,3}", "\\1", text)
-    text = re.sub("```[\\s\\S]*?```", "", text)
-    text = re.sub("#{1,6}\\s*(.*)", "\\1", text)
-    text = re.sub("([-*_]){3,}", "", text)
-    text = re.sub("^>\\s?", "", text, flags=re.MULTILINE)
-    text = re.sub("^\\s*[-+*]\\s+", "", text, flags=re.MULTILINE)
-    text = re.sub("^\\s*\\d+\\.\\s+", "", text, flags=re.MULTILINE)
+    text = _MD_IMG.sub("\\1", text)
+    text = _MD_LINK.sub("\\1", text)
+    text = _MD_STRIKE.sub("\\1", text)
+    text = _MD_CODE.sub("\\1", text)
+    text = _MD_FENCE.sub("", text)
+    text = _MD_HDR.sub("\\1", text)
+    text = _MD_HR.sub("", text)
+    text = _MD_BQ.sub("", text)
+    text = _MD_UL.sub("\\1", text)
+    text = _MD_OL.sub("\\1", text)
     return text.strip()
 
 
@@ -219,9 +355,12 @@ def format_json_for_llm(data, indent=0):
     """
     Formats JSON data into a human-readable string with specified indentation.
 
-    This function takes a JSON object and recursively formats it into a string with the
-    given indentation level. It handles dictionaries, lists, and other types of values,
-    ensuring that each key-value pair is properly indented and formatted for readability.
+    This function walks a JSON object once with an explicit work stack and formats it into a
+    string with the given indentation level. Dictionary keys are written as "key: " followed
+    by the value, nested dictionaries and lists are written on the following lines with two
+    additional spaces of indentation, and list items are written on separate lines at the
+    indentation of the list. All parts are collected in one list and joined at the end, so
+    nested data is not joined again at every level.
 
     Args:
         data (dict or list): The JSON data to be formatted. This can be a dictionary or a
@@ -232,42 +371,38 @@ def format_json_for_llm(data, indent=0):
         str: A human-readable string representation of the JSON data with the specified
             indentation level.
     """
-
-    def format_item(key, value, indent):
-        """
-        Formats a key-value pair into a formatted string with specified indentation.
-
-            This function takes a key and its corresponding value, along with an indent level,
-            and formats them into a string. If the value is a dictionary or list, it recursively
-            formats each item with additional indentation. Otherwise, it simply converts the value
-            to a string.
-
-            Args:
-                key (str): The key for the formatted string.
-                value (dict, list, str): The value corresponding to the key. It can be a dictionary,
-                    list, or any other type that can be converted to a string.
-                indent (int): The level of indentation for the formatted string.
-
-            Returns:
-                str: A formatted string representing the key-value pair with specified indentation.
-        """
-        formatted_str = " " * indent + f"{key}: "
+    parts = []
+    pads = {}
+    # Plain strings on the stack are written as is, tuples are (value, indent) to format
+    stack = [(data, indent)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            parts.append(item)
+            continue
+        value, level = item
+        pad = pads.get(level)
+        if pad is None:
+            pad = pads[level] = " " * level
         if isinstance(value, dict):
-            formatted_str += "\n" + format_json_for_llm(value, indent + 2)
+            items = list(value.items())
+            for i in range(len(items) - 1, -1, -1):
+                key, val = items[i]
+                if isinstance(val, (dict, list)):
+                    stack.append((val, level + 2))
+                    stack.append(pad + f"{key}: \n")
+                else:
+                    stack.append(pad + f"{key}: " + str(val))
+                if i:
+                    stack.append("\n")
         elif isinstance(value, list):
-            formatted_str += "\n" + "\n".join(
-                [format_json_for_llm(item, indent + 2) for item in value]
-            )
+            for i in range(len(value) - 1, -1, -1):
+                stack.append((value[i], level))
+                if i:
+                    stack.append("\n")
         else:
-            formatted_str += str(value)
-        return formatted_str
-
-    if isinstance(data, dict):
-        return "\n".join([format_item(k, v, indent) for k, v in data.items()])
-    elif isinstance(data, list):
-        return "\n".join([format_json_for_llm(item, indent) for item in data])
-    else:
-        return " " * indent + str(data)
+            parts.append(pad + str(value))
+    return "".join(parts)
 
 
 def ts_to_utc(dtg):
@@ -277,8 +412,8 @@ def ts_to_utc(dtg):
     This function attempts to clean up the input datetime string by removing any timezone
     information or offsets, then parses it using ciso8601. If parsing fails, it appends 'Z'
     to indicate UTC and retries parsing. The resulting naive datetime is converted to a
-    float representing seconds since epoch. If any exception occurs during the process,
-    it returns 0.0.
+    float representing seconds since epoch with integer arithmetic on its fields. If any
+    exception occurs during the process, it returns 0.0.
 
     Args:
         dtg (str): A string representing the datetime to be converted.
@@ -288,27 +423,24 @@ def ts_to_utc(dtg):
             occurs.
     """
     try:
-        try:
-            idx = dtg.index(" +")
-            dtg = dtg[0:idx]
-        except ValueError:
-            pass
-        try:
-            idx = dtg.index(" UTC")
-            dtg = dtg[0:idx]
-        except ValueError:
-            pass
-        try:
-            idx = dtg.index("+00:00")
-            dtg = dtg[0:idx]
-        except ValueError:
-            pass
+        # partition keeps the whole string when the separator is missing
+        dtg = dtg.partition(" +")[0]
+        dtg = dtg.partition(" UTC")[0]
+        dtg = dtg.partition("+00:00")[0]
         try:
             _dtg = ciso8601.parse_datetime_as_naive(dtg)
         except ValueError:
             dtg = f"{dtg}Z"
             _dtg = ciso8601.parse_datetime_as_naive(dtg)
-        return round((_dtg - EPOCH).total_seconds(), 6)
+        # Same value as (_dtg - EPOCH).total_seconds() without building a timedelta, the
+        # microseconds are divided exactly so the result needs no rounding
+        seconds = (
+            (_dtg.toordinal() - _EPOCH_ORDINAL) * 86400
+            + _dtg.hour * 3600
+            + _dtg.minute * 60
+            + _dtg.second
+        )
+        return (seconds * 1000000 + _dtg.microsecond) / 1000000
     except Exception as e:
         return 0.0
 
@@ -319,7 +451,9 @@ def trunc_sysmon_event(text):
 
     This function checks if the input text contains 'Microsoft-Windows-Sysmon/Operational'.
     If it does, it extracts lines that start with any of the specified keys and joins them
-    into a new truncated event text. Otherwise, it returns the original text unchanged.
+    into a new truncated event text. The lines are found in a single scan of the text with a
+    precompiled pattern that alternates over all keys. Otherwise, it returns the original
+    text unchanged.
 
     Args:
         text (str): The input text containing system monitoring events.
@@ -329,48 +463,7 @@ def trunc_sysmon_event(text):
              otherwise the original text.
     """
     if "Microsoft-Windows-Sysmon/Operational" in text:
-        keys = (
-            "Channel",
-            "EventID",
-            "SystemTime",
-            "User",
-            "UtcTime",
-            "CommandLine",
-            "Image",
-            "IntegrityLevel",
-            "LogonId",
-            "OriginalFileName",
-            "ParentCommandLine",
-            "ParentImage",
-            "SourceIp",
-            "SourcePort",
-            "DestinationIp",
-            "DestinationPort",
-            "DestinationHostname",
-            "SourceImage",
-            "TargetImage",
-            "StartModule",
-            "StartFunction",
-            "GrantedAccess",
-            "CallTrace",
-            "TargetObject",
-            "EventType",
-            "Details",
-            "EventNamespace",
-            "Name",
-            "Query",
-            "Type",
-            "Destination",
-            "Consumer",
-            "Filter",
-        )
-        new_event = []
-        lines = text.split("\n")
-        for _line in lines:
-            line = _line.strip(" \t")
-            if line.startswith(keys):
-                new_event.append(line)
-        return "\n".join(new_event)
+        return "\n".join(m.group().strip(" \t") for m in _SYSMON_RE.finditer(text))
     else:
         return text
 
@@ -379,9 +472,11 @@ def obj_cp(obj):
     """
     Serializes and deserializes an object using JSON.
 
-    This function takes an object as input, serializes it to a JSON formatted string,
-    and then immediately deserializes it back into a Python object. The purpose of this
-    operation is typically to create a deep copy of the original object.
+    This function takes an object as input, serializes it to JSON bytes with orjson and
+    immediately deserializes it back into a Python object. The purpose of this operation is
+    to create a deep copy of the original object with JSON semantics, so tuples come back as
+    lists. orjson serializes into a native bytes buffer, which is considerably faster than a
+    round trip through the json module.
 
     Args:
         obj (object): The object to be serialized and deserialized.
@@ -389,4 +484,4 @@ def obj_cp(obj):
     Returns:
         object: A new object that is a deep copy of the input object.
     """
-    return json.loads(json.dumps(obj))
+    return orjson.loads(orjson.dumps(obj))
@@ -1,6 +1,19 @@
-import threading
+from concurrent.futures import ThreadPoolExecutor
 from utils.utils import read_llm_config, write_llm_config
 
+# Upper bound of artifact files parsed concurrently by _parse_upload_folder. Only EVTX and
+# MFT files are parsed in batches, the other parsers hold all pages of a file in memory, so
+# files are parsed one at a time to keep the peak memory of large uploads at one file
+PARSE_WORKERS = 1
+# Persistent workers, a single folder worker keeps two parse requests from picking up the
+# same queued files, the file workers parse the files of one request concurrently
+_PARSE_FOLDER_POOL = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="parse_upload_folder"
+)
+_PARSE_FILE_POOL = ThreadPoolExecutor(
+    max_workers=PARSE_WORKERS, thread_name_prefix="parse_upload"
+)
+
 
 def update_config(new_config, logger):
     """
@@ -61,7 +74,8 @@ def monitor_parse_progress(artifact_state_manager, logger):
     Monitors and parses progress of an artifact state manager.
 
     This function attempts to retrieve the status from the provided artifact state manager
-    and returns it as a response dictionary. If any exception occurs during the process,
+    and returns it as a response dictionary, converting the read-only status mapping into a
+    plain dictionary so that it can be serialized. If any exception occurs during the process,
     it logs the error at a critical level and returns the exception message in the response
     dictionary.
 
@@ -73,7 +87,7 @@ def monitor_parse_progress(artifact_state_manager, logger):
         dict: A dictionary containing the status or error message under the key 'response'.
     """
     try:
-        return {"response": artifact_state_manager.get_status()}
+        return {"response": dict(artifact_state_manager.get_status())}
     except Exception as e:
         logger.critical(f"monitor_parse_progress: Raised {e}")
         return {"response": f"{e}"}
@@ -108,9 +122,11 @@ def parse_upload_folder(frag, artifact_state_manager, logger):
     """
     Parses an upload folder using a separate thread.
 
-    This function starts a new thread to parse the upload folder with the given fragment,
-    artifact state manager, and logger. The parsing process is handled by the target
-    function _parse_upload_folder.
+    This function submits the parsing of the upload folder with the given fragment, artifact
+    state manager, and logger to a persistent worker thread instead of starting a new thread
+    per request. Requests are parsed one after another, and an exception raised by the
+    parsing is logged. The parsing process is handled by the target function
+    _parse_upload_folder.
 
     Args:
         frag (Any): The fragment to be parsed.
@@ -119,18 +135,26 @@ def parse_upload_folder(frag, artifact_state_manager, logger):
         logger (logging.Logger): A logger instance used for logging messages and errors
             during the parsing process.
     """
-    _ = threading.Thread(
-        target=_parse_upload_folder, args=(frag, artifact_state_manager, logger)
-    ).start()
+    future = _PARSE_FOLDER_POOL.submit(
+        _parse_upload_folder, frag, artifact_state_manager, logger
+    )
+
+    def log_error(f):
+        if f.exception() is not None:
+            logger.error(f"parse_upload_folder: Raised {f.exception()}")
+
+    future.add_done_callback(log_error)
 
 
 def _parse_upload_folder(frag, artifact_state_manager, logger):
     """
     Parses files from an upload folder and updates their status in the artifact state manager.
 
-    This function retrieves the current status of files from the artifact state manager,
-    processes each file that is queued by adding it to a fragment (frag), logs the number
-    of events parsed, marks the file as done, and then deletes the processed files.
+    This function retrieves the current status of files from the artifact state manager and
+    processes the queued files on the PARSE_WORKERS persistent file workers. Each file is
+    parsed by _parse_upload_file, while its batches are embedded and stored by the single
+    writer thread of the fragment. Once all
+    files are processed, the files that were parsed successfully are deleted.
 
     Args:
         frag (object): The object responsible for handling file additions.
@@ -141,16 +165,47 @@ def _parse_upload_folder(frag, artifact_state_manager, logger):
         None
     """
     work_q = artifact_state_manager.get_status()
+    queued = [
+        filepath for filepath, status in work_q.items() if status["status"] == "queued"
+    ]
+    if not queued:
+        return
+    futures = [
+        _PARSE_FILE_POOL.submit(
+            _parse_upload_file, frag, artifact_state_manager, logger, filepath
+        )
+        for filepath in queued
+    ]
     processed_files = []
-    for filepath, status in work_q.items():
-        if status["status"] == "queued":
-            artifact_state_manager.mark_file_in_progress(filepath)
-            pages_added = frag.add_file(filepath)
-            logger.info(
-                f"_parse_upload_folder: Parsed {pages_added:,} events from {filepath}"
-            )
-            artifact_state_manager.mark_file_done(filepath)
+    for filepath, future in zip(queued, futures):
+        try:
+            future.result()
             processed_files.append(filepath)
+        except Exception as e:
+            logger.error(f"_parse_upload_folder: Parsing {filepath} raised {e}")
     for f in processed_files:
         artifact_state_manager.mark_file_deleted(f)
     return
+
+
+def _parse_upload_file(frag, artifact_state_manager, logger, filepath):
+    """
+    Parses a single queued file and updates its status in the artifact state manager.
+
+    This function marks the file as in progress, adds it to the fragment, logs the number
+    of events parsed and marks the file as done. Exceptions are left to the caller, so a
+    file that fails to parse stays in progress.
+
+    Args:
+        frag (object): The object responsible for handling file additions.
+        artifact_state_manager (object): Manages the status of artifacts and their processing.
+        logger (logging.Logger): A logger instance to log information during processing.
+        filepath (str): The path of the queued file to parse.
+
+    Returns:
+        None
+    """
+    artifact_state_manager.mark_file_in_progress(filepath)
+    pages_added = frag.add_file(filepath)
+    logger.info(f"_parse_upload_folder: Parsed {pages_added:,} events from {filepath}")
+    artifact_state_manager.mark_file_done(filepath)
@@ -1,45 +1,56 @@
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.llm_api import LLMAPI
 from modules.rag_query import RAGQuery
 
+# Persistent RAG pipeline worker, a single worker because all pipelines share one query
+# state manager. New queries are refused as busy until the last pipeline has returned,
+# including a cancelled one that is still winding down
+_RAG_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag")
+_rag_future = None
+_rag_lock = threading.Lock()
+
 
 def data_query(query_dict, frag, logger):
-    res = [ ]
     try:
         pages, meta = frag.query(query_dict)
-        for idx, page in enumerate(pages):
-            res.append(
-                {
-                    "meta": meta[idx],
-                    "event": page,
-                }
-            )
+        return [{"meta": m, "event": page} for page, m in zip(pages, meta)]
     except Exception as e:
         logger.error(f"data_query: raised {e}")
-    return res
+    return []
 
 def stream_query(query_dict, frag, query_state_manager, llm_config, logger):
+    global _rag_future
     query_type = query_dict.get("query_type")
     match query_type:
         case "new_rag_query":
-            if query_state_manager.is_status_idle() is False:
-                return { "response": "busy" }
-                
-            # Reset object
-            query_state_manager.reset_query()
-
-            # Not busy, start new thread
-            _ = threading.Thread(
-                target=execute_new_rag_pipeline,
-                args=(
+            with _rag_lock:
+                if query_state_manager.is_status_idle() is False or (
+                    _rag_future is not None and _rag_future.done() is False
+                ):
+                    return { "response": "busy" }
+
+                # Reset object, it is active before the pipeline is queued
+                query_state_manager.reset_query()
+                query_state_manager.set_status_active()
+
+                # Not busy, hand the pipeline to a persistent worker
+                future = _RAG_POOL.submit(
+                    execute_new_rag_pipeline,
                     query_dict,
                     frag,
                     query_state_manager,
                     llm_config,
                     logger,
-                ),
-            ).start()
+                )
+                _rag_future = future
+
+            def log_error(f):
+                if f.exception() is not None:
+                    logger.error(f"stream_query: Raised {f.exception()}")
+
+            future.add_done_callback(log_error)
             return { "response": query_state_manager.get_query_id() }
         
         case "rag_query_status":
@@ -50,8 +61,6 @@ def stream_query(query_dict, frag, query_state_manager, llm_config, logger):
             return { "response": "OK" }
 
 def execute_new_rag_pipeline(query_dict, frag, query_state_manager, llm_config, logger):
-    query_state_manager.set_status_active()
-    
     llm_api = LLMAPI(llm_config, logger)
 
     rag_query = RAGQuery(query_dict, llm_api, frag, query_state_manager, llm_config, logger)